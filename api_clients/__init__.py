@@ -1,7 +1,8 @@
-from .base_client import BaseAPIClient, APIResponse
+from .base_client import BaseAPIClient, APIResponse, Deadline, RequestTimeoutError
 from .openai_client import OpenAIClient
 from .anthropic_client import AnthropicClient
 from .generic_client import BaiduClient, ZhipuClient, AlibabaClient
+from .cassette import Cassette, CassetteMissError, CassetteReplayError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,9 +24,14 @@ class APIClientFactory:
         client_class = cls.client_mapping.get(platform_name)
         
         if client_class:
-            return client_class(platform_config)
+            try:
+                return client_class(platform_config)
+            except ImportError as e:
+                logger.error(f"{platform_name}客户端依赖未安装: {str(e)}")
+                return None
         else:
             logger.warning(f"未找到{platform_name}的客户端实现，使用默认客户端")
             return None
 
-__all__ = ['BaseAPIClient', 'APIResponse', 'APIClientFactory']
\ No newline at end of file
+__all__ = ['BaseAPIClient', 'APIResponse', 'Deadline', 'RequestTimeoutError', 'Cassette', 'CassetteMissError',
+           'CassetteReplayError', 'APIClientFactory']
\ No newline at end of file
@@ -1,23 +1,32 @@
-from anthropic import Anthropic
-from .base_client import BaseAPIClient, APIResponse
+from anthropic import Anthropic, NOT_GIVEN
+from .base_client import BaseAPIClient, APIResponse, Deadline
+from .transport import install_httpx_deadline
 import logging
 
+from profiler import section
+from tracing import get_tracer
+
 logger = logging.getLogger(__name__)
 
 class AnthropicClient(BaseAPIClient):
     def __init__(self, platform_config):
         super().__init__(platform_config)
+        # 重试由BaseAPIClient在截止时间内完成，SDK只负责单次尝试
         self.client = Anthropic(
-            api_key=platform_config.api_key
+            api_key=platform_config.api_key,
+            max_retries=0
         )
+        install_httpx_deadline(getattr(self.client, '_client', None))
+        get_tracer().instrument_httpx(getattr(self.client, '_client', None))
     
-    def call_api(self, prompt: str, model_config) -> APIResponse:
+    def call_api(self, prompt: str, model_config, deadline: Deadline) -> APIResponse:
         try:
             message = self.client.messages.create(
                 model=model_config.name,
                 max_tokens=model_config.max_tokens,
                 temperature=model_config.temperature,
-                messages=self.format_messages(prompt)
+                messages=self.format_messages(prompt),
+                timeout=deadline.remaining() if deadline.timeout else NOT_GIVEN
             )
             
             response_text = message.content[0].text
@@ -27,6 +36,9 @@ class AnthropicClient(BaseAPIClient):
                 "total_tokens": message.usage.input_tokens + message.usage.output_tokens
             }
             
+            with section("sdk.model_dump"):
+                raw_response = message.model_dump()
+            
             return APIResponse(
                 platform=self.platform_name,
                 model=model_config.name,
@@ -35,7 +47,7 @@ class AnthropicClient(BaseAPIClient):
                 usage=usage,
                 latency=0,
                 success=True,
-                raw_response=message.model_dump()
+                raw_response=raw_response
             )
         except Exception as e:
             logger.error(f"Anthropic API调用失败: {str(e)}")
@@ -1,9 +1,14 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
 from dataclasses import dataclass
+import random
+import threading
 import time
 import logging
 
+from profiler import section
+from tracing import get_tracer
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -17,23 +22,174 @@ class APIResponse:
     success: bool
     error: Optional[str] = None
     raw_response: Optional[Dict[str, Any]] = None
+    timestamp: Optional[float] = None
+    timed_out: bool = False
+
+class RequestTimeoutError(Exception):
+    """请求超过截止时间"""
+
+_active = threading.local()
+
+class Deadline:
+    """单次请求的端到端截止时间，timeout为空时不限制
+    
+    用with语句激活后成为当前线程的截止时间，transport模块中的网络层在每次连接、
+    收发数据时据此重新计算socket超时，保证整个请求的耗时不超过截止时间。
+    """
+    
+    def __init__(self, timeout: Optional[float]):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout if timeout else None
+        self._previous = None
+    
+    def __enter__(self) -> 'Deadline':
+        self._previous = getattr(_active, 'deadline', None)
+        _active.deadline = self
+        return self
+    
+    def __exit__(self, *exc):
+        _active.deadline = self._previous
+        return False
+    
+    @staticmethod
+    def current() -> Optional['Deadline']:
+        """当前线程正在执行的请求的截止时间"""
+        return getattr(_active, 'deadline', None)
+    
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+    
+    def time_left(self) -> Optional[float]:
+        """剩余时间（秒），不限制时为None，已超时时为0或负数"""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+    
+    def remaining(self) -> Optional[float]:
+        """剩余时间（秒），已超时则抛出RequestTimeoutError"""
+        remaining = self.time_left()
+        if remaining is not None and remaining <= 0:
+            raise RequestTimeoutError(f"请求超时(>{self.timeout}s)")
+        return remaining
+    
+    def check(self):
+        self.remaining()
+
+def is_timeout_error(error: BaseException) -> bool:
+    """判断异常是否为超时，兼容各SDK的超时异常(APITimeoutError、requests.Timeout等)"""
+    if isinstance(error, (RequestTimeoutError, TimeoutError)):
+        return True
+    return any('Timeout' in cls.__name__ for cls in type(error).__mro__)
+
+# 默认重试次数，与OpenAI/Anthropic SDK的默认值一致
+DEFAULT_MAX_RETRIES = 2
+# 指数退避的初始等待和最大等待（秒）
+INITIAL_RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 8.0
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+def is_retryable_error(error: BaseException) -> bool:
+    """判断失败是否值得重试：限流(429)、服务端错误(5xx)、连接错误和单次尝试超时
+    
+    异常自带retryable属性时（如回放录制的错误）以它为准。
+    """
+    retryable = getattr(error, 'retryable', None)
+    if isinstance(retryable, bool):
+        return retryable
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    if is_timeout_error(error):
+        return True
+    return any('Connection' in cls.__name__ for cls in type(error).__mro__)
+
+def retry_delay(error: BaseException, attempt: int) -> float:
+    """第attempt次重试前的等待时间，优先使用响应头中的Retry-After"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if headers is not None:
+        try:
+            retry_after = float(headers.get('retry-after'))
+            if 0 <= retry_after <= 60:
+                return retry_after
+        except (TypeError, ValueError):
+            pass
+    delay = min(INITIAL_RETRY_DELAY * 2 ** attempt, MAX_RETRY_DELAY)
+    return delay * (1 - 0.25 * random.random())
 
 class BaseAPIClient(ABC):
     def __init__(self, platform_config):
         self.config = platform_config
         self.platform_name = platform_config.name
+        self.timeout = platform_config.timeout
+        self.max_retries = platform_config.max_retries if platform_config.max_retries is not None else DEFAULT_MAX_RETRIES
+        # 录制/回放用的Cassette，为空时直接调用API
+        self.cassette = None
     
     @abstractmethod
-    def call_api(self, prompt: str, model_config) -> APIResponse:
+    def call_api(self, prompt: str, model_config, deadline: Deadline) -> APIResponse:
+        """调用API（单次尝试，重试由基类完成）
+        
+        实现时需把deadline.remaining()作为底层请求的超时时间，并使用transport模块的
+        网络层，保证超时后请求被真正取消。
+        """
         pass
     
-    def test_model(self, prompt: str, model_config) -> APIResponse:
+    def test_model(self, prompt: str, model_config, enqueued_ns: Optional[int] = None) -> APIResponse:
+        """执行一次测试请求
+        
+        enqueued_ns为任务进入队列的时间(time.time_ns())，开启追踪时用于记录排队阶段。
+        """
+        tracer = get_tracer()
+        with tracer.span("request", platform=self.platform_name, model=model_config.name) as span:
+            if tracer.enabled and enqueued_ns is not None:
+                tracer.add_span("queue", enqueued_ns, span.start_ns)
+                span.start_ns = enqueued_ns
+            
+            response = self._timed_call(prompt, model_config)
+            
+            span.set(
+                success=response.success,
+                timed_out=response.timed_out,
+                latency=response.latency,
+                completion_tokens=response.usage.get('completion_tokens') if response.usage else None,
+                error=response.error
+            )
+            span.error = not response.success
+            return response
+    
+    def _timed_call(self, prompt: str, model_config) -> APIResponse:
         start_time = time.time()
+        deadline = Deadline(self.timeout)
         try:
-            response = self.call_api(prompt, model_config)
+            with section("api_call"), deadline:
+                response = self._call_with_retries(prompt, model_config, deadline)
             response.latency = time.time() - start_time
+            response.timestamp = start_time
+            if deadline.expired():
+                raise RequestTimeoutError(f"请求超时(>{self.timeout}s)")
             return response
         except Exception as e:
+            if is_timeout_error(e):
+                elapsed = time.time() - start_time
+                logger.warning(f"调用{self.platform_name} {model_config.name}超时: {elapsed:.2f}s")
+                return APIResponse(
+                    platform=self.platform_name,
+                    model=model_config.name,
+                    prompt=prompt,
+                    response="",
+                    usage={},
+                    latency=elapsed,
+                    success=False,
+                    error=str(e) if isinstance(e, RequestTimeoutError) else f"请求超时(>{self.timeout}s): {str(e)}",
+                    timestamp=start_time,
+                    timed_out=True
+                )
+
             logger.error(f"调用{self.platform_name} {model_config.name}失败: {str(e)}")
             return APIResponse(
                 platform=self.platform_name,
@@ -43,9 +199,53 @@ class BaseAPIClient(ABC):
                 usage={},
                 latency=time.time() - start_time,
                 success=False,
-                error=str(e)
+                error=str(e),
+                timestamp=start_time
             )
     
+    def _call_with_retries(self, prompt: str, model_config, deadline: Deadline) -> APIResponse:
+        """失败时按指数退避重试，重试和等待都限制在截止时间内，等不到下一次尝试时直接返回最后的错误
+        
+        开启追踪时每次尝试记为一个attempt span，重试前的等待记为backoff span。
+        """
+        tracer = get_tracer()
+        attempt = 0
+        while True:
+            try:
+                with tracer.span("attempt", attempt=attempt + 1):
+                    return self._call_with_cassette(prompt, model_config, deadline)
+            except Exception as e:
+                if attempt >= self.max_retries or deadline.expired() or not is_retryable_error(e):
+                    raise
+                delay = retry_delay(e, attempt)
+                remaining = deadline.time_left()
+                if remaining is not None and delay >= remaining:
+                    raise
+                attempt += 1
+                logger.warning(f"调用{self.platform_name} {model_config.name}失败，{delay:.1f}s后第{attempt}次重试: {str(e)}")
+                with tracer.span("backoff", delay=delay):
+                    time.sleep(delay)
+    
+    def _call_with_cassette(self, prompt: str, model_config, deadline: Deadline) -> APIResponse:
+        """未设置cassette时直接调用API；回放模式返回录制的响应；录制模式调用API并保存结果"""
+        cassette = self.cassette
+        if cassette is None:
+            return self.call_api(prompt, model_config, deadline)
+        
+        if cassette.replaying:
+            return cassette.replay(self.platform_name, prompt, model_config, deadline)
+        
+        start = time.perf_counter()
+        try:
+            response = self.call_api(prompt, model_config, deadline)
+        except Exception as e:
+            cassette.record(self.platform_name, prompt, model_config, time.perf_counter() - start,
+                            error=e, timed_out=is_timeout_error(e))
+            raise
+        cassette.record(self.platform_name, prompt, model_config, time.perf_counter() - start,
+                        response=response)
+        return response
+    
     def format_messages(self, prompt: str) -> list:
         return [
             {"role": "user", "content": prompt}
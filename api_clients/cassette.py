@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+import logging
+
+from .base_client import APIResponse, Deadline, RequestTimeoutError, _status_code, is_retryable_error
+
+logger = logging.getLogger(__name__)
+
+# 参与请求匹配的模型参数
+REQUEST_PARAMETERS = ('max_tokens', 'temperature', 'top_p', 'frequency_penalty', 'presence_penalty')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exchanges (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    platform TEXT NOT NULL,
+    model TEXT NOT NULL,
+    latency REAL NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_exchanges_key_seq ON exchanges (key, seq);
+"""
+
+class CassetteMissError(Exception):
+    """回放时找不到匹配的录制记录"""
+
+class ReplayedResponse:
+    """回放错误附带的响应，只包含状态码和重试相关的响应头"""
+
+    def __init__(self, status_code: Optional[int], headers: Dict[str, str]):
+        self.status_code = status_code
+        self.headers = headers
+
+class CassetteReplayError(Exception):
+    """回放录制的错误，保留原始的状态码、Retry-After和是否可重试，使重试逻辑与录制时一致"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, headers: Optional[Dict[str, str]] = None,
+                 retryable: Optional[bool] = None, error_type: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = ReplayedResponse(status_code, headers or {})
+        self.retryable = retryable
+        self.error_type = error_type
+
+class Cassette:
+    """API调用的录制与回放
+
+    录制模式下保存每次调用的请求、响应文本、token用量、原始响应、耗时和错误；
+    回放模式下按请求匹配录制记录，并按原始耗时(乘以time_scale)等待后返回，不发起真实请求。
+
+    记录保存在SQLite文件中，每条记录的内容单独用zlib压缩，并按请求键建立索引，
+    回放时只读取和解压需要的记录。同一请求被录制多次时按录制顺序循环回放。
+    """
+
+    RECORD = 'record'
+    REPLAY = 'replay'
+
+    def __init__(self, path: str, mode: str, time_scale: float = 1.0, commit_every: int = 100):
+        if mode not in (self.RECORD, self.REPLAY):
+            raise ValueError(f"不支持的cassette模式: {mode}")
+        if mode == self.REPLAY and not os.path.isfile(path):
+            # 回放时不能新建空文件，否则所有调用都会因找不到记录而失败
+            raise FileNotFoundError(f"cassette文件不存在: {path}")
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self.commit_every = commit_every
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+        self._pending = 0
+        self._next_seq: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        self._cursors: Dict[str, int] = {}
+
+        if self.replaying:
+            # 回放前一次性从索引读出每个请求键的记录数，之后每次回放只需一次按键查询
+            self._counts = dict(self.conn.execute("SELECT key, COUNT(*) FROM exchanges GROUP BY key"))
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == self.REPLAY
+
+    @staticmethod
+    def request_key(platform: str, prompt: str, model_config) -> str:
+        request = [platform, model_config.name, prompt]
+        request.extend(getattr(model_config, name, None) for name in REQUEST_PARAMETERS)
+        return hashlib.sha1(json.dumps(request, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def record(self, platform: str, prompt: str, model_config, latency: float,
+               response: Optional[APIResponse] = None, error: Optional[BaseException] = None,
+               timed_out: bool = False, chunk_timings: Optional[list] = None):
+        """保存一次调用（成功的响应或抛出的错误）"""
+        key = self.request_key(platform, prompt, model_config)
+        payload: Dict[str, Any] = {
+            'request': {
+                'platform': platform,
+                'model': model_config.name,
+                'prompt': prompt,
+                **{name: getattr(model_config, name, None) for name in REQUEST_PARAMETERS}
+            },
+            'latency': latency,
+            'chunk_timings': chunk_timings or [],
+            'timed_out': timed_out
+        }
+        if response is not None:
+            payload['response'] = response.response
+            payload['usage'] = response.usage
+            payload['raw_response'] = response.raw_response
+        if error is not None:
+            payload['error'] = str(error)
+            payload['error_type'] = type(error).__name__
+            payload['status_code'] = _status_code(error)
+            payload['retryable'] = is_retryable_error(error)
+            headers = getattr(getattr(error, 'response', None), 'headers', None)
+            retry_after = headers.get('retry-after') if headers is not None else None
+            if retry_after is not None:
+                payload['headers'] = {'retry-after': retry_after}
+
+        blob = zlib.compress(json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8'))
+
+        with self._lock:
+            seq = self._next_seq.get(key)
+            if seq is None:
+                row = self.conn.execute("SELECT MAX(seq) FROM exchanges WHERE key = ?", (key,)).fetchone()
+                seq = 0 if row[0] is None else row[0] + 1
+            self._next_seq[key] = seq + 1
+
+            self.conn.execute(
+                "INSERT INTO exchanges (key, seq, platform, model, latency, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, seq, platform, model_config.name, latency, blob)
+            )
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self.conn.commit()
+                self._pending = 0
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            count = self._counts.get(key, 0)
+            if count == 0:
+                return None
+
+            seq = self._cursors.get(key, 0)
+            self._cursors[key] = (seq + 1) % count
+            row = self.conn.execute("SELECT payload FROM exchanges WHERE key = ? AND seq = ?", (key, seq)).fetchone()
+
+        return json.loads(zlib.decompress(row[0]))
+
+    def replay(self, platform: str, prompt: str, model_config, deadline: Deadline) -> APIResponse:
+        """按录制内容返回响应，等待时间为原始耗时乘以time_scale，超过截止时间时按超时处理"""
+        exchange = self._load(self.request_key(platform, prompt, model_config))
+        if exchange is None:
+            raise CassetteMissError(f"cassette中没有匹配的记录: {platform} {model_config.name}")
+
+        delay = exchange['latency'] * self.time_scale
+        remaining = deadline.remaining()
+        if remaining is not None and delay >= remaining:
+            time.sleep(remaining)
+            raise RequestTimeoutError(f"请求超时(>{deadline.timeout}s)")
+        if delay > 0:
+            time.sleep(delay)
+
+        if 'error' in exchange:
+            if exchange.get('timed_out'):
+                raise RequestTimeoutError(exchange['error'])
+            raise CassetteReplayError(
+                exchange['error'],
+                status_code=exchange.get('status_code'),
+                headers=exchange.get('headers'),
+                retryable=exchange.get('retryable'),
+                error_type=exchange.get('error_type')
+            )
+
+        return APIResponse(
+            platform=platform,
+            model=model_config.name,
+            prompt=prompt,
+            response=exchange['response'],
+            usage=exchange['usage'],
+            latency=0,
+            success=True,
+            raw_response=exchange.get('raw_response')
+        )
+
+    def flush(self):
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -1,25 +1,79 @@
 import requests
 import json
+import threading
 import time
-from .base_client import BaseAPIClient, APIResponse
+from .base_client import BaseAPIClient, APIResponse, Deadline, RequestTimeoutError
+from .transport import DeadlineHTTPAdapter, install_httpx_deadline
 import logging
 import hashlib
 import hmac
 
+from profiler import section
+from tracing import get_tracer
+
 logger = logging.getLogger(__name__)
 
 class GenericHTTPClient(BaseAPIClient):
-    """通用HTTP客户端，用于处理基于HTTP请求的LLM API"""
+    """通用HTTP客户端，用于处理基于HTTP请求的LLM API
+    
+    每个实例持有独立的requests.Session和连接池，凭证只保存在实例上，
+    多个线程可以同时使用同一个实例发起请求。
+    """
+    
+    # 每个客户端连接池保持的最大连接数
+    pool_maxsize = 32
     
     def __init__(self, platform_config):
         super().__init__(platform_config)
         self.api_key = platform_config.api_key
         self.secret_key = platform_config.secret_key
         self.base_url = platform_config.base_url
+        
+        self.session = requests.Session()
+        adapter = DeadlineHTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
     
-    def call_api(self, prompt: str, model_config) -> APIResponse:
+    def call_api(self, prompt: str, model_config, deadline: Deadline) -> APIResponse:
         """子类应该重写此方法以实现具体的API调用"""
         raise NotImplementedError("子类必须实现call_api方法")
+    
+    def request_json(self, method: str, url: str, deadline: Deadline, **kwargs) -> dict:
+        """发送HTTP请求并解析JSON响应
+        
+        requests的timeout只限制单次socket操作，连接池使用DeadlineHTTPAdapter，每次收发数据前
+        按剩余时间重新设置socket超时，保证整个请求不会超过deadline。限流(429)和服务端错误(5xx)
+        抛出requests.HTTPError，由基类决定是否重试。
+        """
+        tracer = get_tracer()
+        try:
+            # stream=True时request在收到响应头后返回，这段时间包含建立连接，记为ttfb
+            sent_ns = time.time_ns()
+            response = self.session.request(method, url, timeout=deadline.remaining(), stream=True, **kwargs)
+            headers_ns = time.time_ns()
+            tracer.add_span("ttfb", sent_ns, headers_ns, includes_connect=True, status_code=response.status_code)
+            try:
+                chunks = []
+                for chunk in response.iter_content(chunk_size=1024):
+                    deadline.check()
+                    chunks.append(chunk)
+            finally:
+                response.close()
+                tracer.add_span("stream", headers_ns, time.time_ns())
+        except RequestTimeoutError:
+            raise
+        except Exception as e:
+            # 截止时间到达时socket读写超时，requests可能把它包装成ConnectionError
+            if deadline.expired():
+                raise RequestTimeoutError(f"请求超时(>{deadline.timeout}s)") from e
+            raise
+        
+        body = b"".join(chunks)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise requests.HTTPError(
+                f"HTTP {response.status_code}: {body[:200].decode('utf-8', 'replace')}", response=response
+            )
+        return json.loads(body)
 
 class BaiduClient(GenericHTTPClient):
     """百度文心一言API客户端"""
@@ -28,12 +82,19 @@ class BaiduClient(GenericHTTPClient):
         super().__init__(platform_config)
         self.access_token = None
         self.token_expire_time = 0
+        self._token_lock = threading.Lock()
     
-    def get_access_token(self):
-        """获取百度API的access token"""
+    def get_access_token(self, deadline: Deadline):
+        """获取百度API的access token，多线程并发时只有一个线程负责刷新"""
         if self.access_token and time.time() < self.token_expire_time:
             return self.access_token
         
+        with self._token_lock:
+            if self.access_token and time.time() < self.token_expire_time:
+                return self.access_token
+            return self._refresh_access_token(deadline)
+    
+    def _refresh_access_token(self, deadline: Deadline):
         url = "https://aip.baidubce.com/oauth/2.0/token"
         params = {
             "grant_type": "client_credentials",
@@ -41,19 +102,18 @@ class BaiduClient(GenericHTTPClient):
             "client_secret": self.secret_key
         }
         
-        response = requests.get(url, params=params)
-        result = response.json()
+        result = self.request_json("GET", url, deadline, params=params)
         
         if "access_token" in result:
-            self.access_token = result["access_token"]
             self.token_expire_time = time.time() + result.get("expires_in", 3600) - 60
+            self.access_token = result["access_token"]
             return self.access_token
         else:
             raise Exception(f"获取百度access token失败: {result}")
     
-    def call_api(self, prompt: str, model_config) -> APIResponse:
+    def call_api(self, prompt: str, model_config, deadline: Deadline) -> APIResponse:
         try:
-            access_token = self.get_access_token()
+            access_token = self.get_access_token(deadline)
             
             # 根据模型名称构建URL
             model_endpoints = {
@@ -74,8 +134,7 @@ class BaiduClient(GenericHTTPClient):
                 "max_output_tokens": model_config.max_tokens
             }
             
-            response = requests.post(url, headers=headers, params=params, json=data)
-            result = response.json()
+            result = self.request_json("POST", url, deadline, headers=headers, params=params, json=data)
             
             if "error_code" in result:
                 raise Exception(f"百度API错误: {result}")
@@ -101,25 +160,45 @@ class BaiduClient(GenericHTTPClient):
             logger.error(f"百度API调用失败: {str(e)}")
             raise
 
-class ZhipuClient(GenericHTTPClient):
-    """智谱AI API客户端"""
+class ZhipuClient(BaseAPIClient):
+    """智谱AI API客户端
+    
+    使用zhipuai SDK的ZhipuAI客户端，每个实例创建一次并持有自己的api_key和连接池，
+    不修改SDK的全局状态，可以在多个线程中同时调用。请求都经过SDK内部的httpx客户端，
+    不需要GenericHTTPClient的requests连接池。
+    """
+    
+    def __init__(self, platform_config):
+        super().__init__(platform_config)
+        from zhipuai import ZhipuAI
+        
+        client_options = {"api_key": platform_config.api_key, "max_retries": 0}
+        if platform_config.base_url:
+            client_options["base_url"] = platform_config.base_url
+        self.client = ZhipuAI(**client_options)
+        install_httpx_deadline(getattr(self.client, '_client', None))
+        get_tracer().instrument_httpx(getattr(self.client, '_client', None))
     
-    def call_api(self, prompt: str, model_config) -> APIResponse:
+    def call_api(self, prompt: str, model_config, deadline: Deadline) -> APIResponse:
         try:
-            import zhipuai
-            
-            zhipuai.api_key = self.api_key
+            request_options = {}
+            if deadline.timeout:
+                request_options["timeout"] = deadline.remaining()
             
-            response = zhipuai.ChatCompletion.create(
+            response = self.client.chat.completions.create(
                 model=model_config.name,
                 messages=self.format_messages(prompt),
                 temperature=model_config.temperature,
-                max_tokens=model_config.max_tokens
+                max_tokens=model_config.max_tokens,
+                **request_options
             )
             
             response_text = response.choices[0].message.content
             usage = response.usage
             
+            with section("sdk.model_dump"):
+                raw_response = response.model_dump()
+            
             return APIResponse(
                 platform=self.platform_name,
                 model=model_config.name,
@@ -132,50 +211,64 @@ class ZhipuClient(GenericHTTPClient):
                 },
                 latency=0,
                 success=True,
-                raw_response=response
+                raw_response=raw_response
             )
         except Exception as e:
             logger.error(f"智谱API调用失败: {str(e)}")
             raise
 
 class AlibabaClient(GenericHTTPClient):
-    """阿里云通义千问API客户端"""
+    """阿里云通义千问API客户端
+    
+    直接调用DashScope的HTTP接口，api_key通过请求头传递，请求复用实例自身的连接池，
+    避免修改dashscope模块的全局api_key，可以在多个线程中同时调用。
+    """
+    
+    default_base_url = "https://dashscope.aliyuncs.com/api/v1"
     
-    def call_api(self, prompt: str, model_config) -> APIResponse:
+    def __init__(self, platform_config):
+        super().__init__(platform_config)
+        base_url = (self.base_url or self.default_base_url).rstrip("/")
+        self.generation_url = f"{base_url}/services/aigc/text-generation/generation"
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+    
+    def call_api(self, prompt: str, model_config, deadline: Deadline) -> APIResponse:
         try:
-            import dashscope
-            from dashscope import Generation
+            data = {
+                "model": model_config.name,
+                "input": {"messages": self.format_messages(prompt)},
+                "parameters": {
+                    "temperature": model_config.temperature,
+                    "max_tokens": model_config.max_tokens,
+                    "result_format": "message"
+                }
+            }
             
-            dashscope.api_key = self.api_key
+            result = self.request_json("POST", self.generation_url, deadline, headers=self.headers, json=data)
             
-            response = Generation.call(
+            if "output" not in result:
+                raise Exception(f"阿里云API错误: {result}")
+            
+            response_text = result["output"]["choices"][0]["message"]["content"]
+            usage = result.get("usage", {})
+            
+            return APIResponse(
+                platform=self.platform_name,
                 model=model_config.name,
-                messages=self.format_messages(prompt),
-                temperature=model_config.temperature,
-                max_tokens=model_config.max_tokens,
-                result_format='message'
+                prompt=prompt,
+                response=response_text,
+                usage={
+                    "prompt_tokens": usage.get("input_tokens", 0),
+                    "completion_tokens": usage.get("output_tokens", 0),
+                    "total_tokens": usage.get("total_tokens", 0)
+                },
+                latency=0,
+                success=True,
+                raw_response=result
             )
-            
-            if response.status_code == 200:
-                response_text = response.output.choices[0].message.content
-                usage = response.usage
-                
-                return APIResponse(
-                    platform=self.platform_name,
-                    model=model_config.name,
-                    prompt=prompt,
-                    response=response_text,
-                    usage={
-                        "prompt_tokens": usage.input_tokens,
-                        "completion_tokens": usage.output_tokens,
-                        "total_tokens": usage.total_tokens
-                    },
-                    latency=0,
-                    success=True,
-                    raw_response=response
-                )
-            else:
-                raise Exception(f"阿里云API错误: {response}")
         except Exception as e:
             logger.error(f"阿里云API调用失败: {str(e)}")
-            raise
\ No newline at end of file
+            raise
@@ -1,18 +1,26 @@
-from openai import OpenAI
-from .base_client import BaseAPIClient, APIResponse
+from openai import OpenAI, NOT_GIVEN
+from .base_client import BaseAPIClient, APIResponse, Deadline
+from .transport import install_httpx_deadline
 import logging
 
+from profiler import section
+from tracing import get_tracer
+
 logger = logging.getLogger(__name__)
 
 class OpenAIClient(BaseAPIClient):
     def __init__(self, platform_config):
         super().__init__(platform_config)
+        # 重试由BaseAPIClient在截止时间内完成，SDK只负责单次尝试
         self.client = OpenAI(
             api_key=platform_config.api_key,
-            base_url=platform_config.base_url if platform_config.base_url else None
+            base_url=platform_config.base_url if platform_config.base_url else None,
+            max_retries=0
         )
+        install_httpx_deadline(getattr(self.client, '_client', None))
+        get_tracer().instrument_httpx(getattr(self.client, '_client', None))
     
-    def call_api(self, prompt: str, model_config) -> APIResponse:
+    def call_api(self, prompt: str, model_config, deadline: Deadline) -> APIResponse:
         try:
             completion = self.client.chat.completions.create(
                 model=model_config.name,
@@ -21,7 +29,8 @@ class OpenAIClient(BaseAPIClient):
                 temperature=model_config.temperature,
                 top_p=model_config.top_p if model_config.top_p else 1.0,
                 frequency_penalty=model_config.frequency_penalty if model_config.frequency_penalty else 0,
-                presence_penalty=model_config.presence_penalty if model_config.presence_penalty else 0
+                presence_penalty=model_config.presence_penalty if model_config.presence_penalty else 0,
+                timeout=deadline.remaining() if deadline.timeout else NOT_GIVEN
             )
             
             response_text = completion.choices[0].message.content
@@ -31,6 +40,9 @@ class OpenAIClient(BaseAPIClient):
                 "total_tokens": completion.usage.total_tokens
             }
             
+            with section("sdk.model_dump"):
+                raw_response = completion.model_dump()
+            
             return APIResponse(
                 platform=self.platform_name,
                 model=model_config.name,
@@ -39,7 +51,7 @@ class OpenAIClient(BaseAPIClient):
                 usage=usage,
                 latency=0,
                 success=True,
-                raw_response=completion.model_dump()
+                raw_response=raw_response
             )
         except Exception as e:
             logger.error(f"OpenAI API调用失败: {str(e)}")
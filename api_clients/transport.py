@@ -0,0 +1,170 @@
+import io
+import socket
+import sys
+from typing import Optional
+import logging
+
+import httpcore
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .base_client import Deadline
+
+logger = logging.getLogger(__name__)
+
+def bounded_timeout(timeout: Optional[float], timeout_error: type) -> Optional[float]:
+    """按当前线程请求的剩余时间收紧单次网络操作的超时，已超时则抛出timeout_error
+
+    httpx和requests的timeout都只限制单次连接或读写，服务端持续缓慢发送数据时整个请求
+    可以远超timeout。每次操作前都用剩余时间重新计算超时，整个请求就不会超过截止时间。
+    """
+    deadline = Deadline.current()
+    remaining = deadline.time_left() if deadline is not None else None
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise timeout_error(f"请求超时(>{deadline.timeout}s)")
+    return remaining if timeout is None else min(timeout, remaining)
+
+class DeadlineNetworkStream(httpcore.NetworkStream):
+    """httpcore连接的包装，每次读写前按截止时间重新计算超时
+
+    errors为原网络层所属的包（httpcore，或部分SDK版本使用的httpcore2），超时时抛出该包中的
+    超时异常，httpx才能把它转换为自己的超时异常。
+    """
+
+    def __init__(self, stream: httpcore.NetworkStream, errors=httpcore):
+        self._stream = stream
+        self._errors = errors
+
+    def read(self, max_bytes: int, timeout: Optional[float] = None) -> bytes:
+        return self._stream.read(max_bytes, bounded_timeout(timeout, self._errors.ReadTimeout))
+
+    def write(self, buffer: bytes, timeout: Optional[float] = None) -> None:
+        self._stream.write(buffer, bounded_timeout(timeout, self._errors.WriteTimeout))
+
+    def close(self) -> None:
+        self._stream.close()
+
+    def start_tls(self, ssl_context, server_hostname=None, timeout=None) -> httpcore.NetworkStream:
+        timeout = bounded_timeout(timeout, self._errors.ConnectTimeout)
+        return DeadlineNetworkStream(self._stream.start_tls(ssl_context, server_hostname, timeout), self._errors)
+
+    def get_extra_info(self, info: str):
+        return self._stream.get_extra_info(info)
+
+class DeadlineNetworkBackend(httpcore.NetworkBackend):
+    def __init__(self, backend: httpcore.NetworkBackend):
+        self._backend = backend
+        self._errors = sys.modules.get(type(backend).__module__.split('.')[0], httpcore)
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        timeout = bounded_timeout(timeout, self._errors.ConnectTimeout)
+        stream = self._backend.connect_tcp(host, port, timeout, local_address, socket_options)
+        return DeadlineNetworkStream(stream, self._errors)
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        timeout = bounded_timeout(timeout, self._errors.ConnectTimeout)
+        return DeadlineNetworkStream(self._backend.connect_unix_socket(path, timeout, socket_options), self._errors)
+
+    def sleep(self, seconds: float) -> None:
+        self._backend.sleep(seconds)
+
+def install_httpx_deadline(http_client) -> bool:
+    """为SDK内部的httpx客户端（包括代理对应的transport）换上受截止时间限制的网络层
+
+    依赖httpx/httpcore的内部属性，找不到可替换的网络层时记录警告并返回False，
+    此时请求只受单次读写超时限制，服务端持续缓慢发送数据时可能超过截止时间。
+    """
+    installed = False
+    transports = [getattr(http_client, '_transport', None)]
+    transports.extend((getattr(http_client, '_mounts', None) or {}).values())
+    for transport in transports:
+        pool = getattr(transport, '_pool', None)
+        backend = getattr(pool, '_network_backend', None)
+        if isinstance(backend, DeadlineNetworkBackend):
+            installed = True
+        elif backend is not None and hasattr(backend, 'connect_tcp'):
+            pool._network_backend = DeadlineNetworkBackend(backend)
+            installed = True
+    if not installed:
+        logger.warning("无法为httpx客户端安装截止时间网络层，请求总耗时可能超过timeout")
+    return installed
+
+class DeadlineSocket:
+    """已连接socket的包装，每次收发前按截止时间重新设置socket超时，其余操作交给原socket"""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._timeout = sock.gettimeout()
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def settimeout(self, timeout: Optional[float]):
+        self._timeout = timeout
+        self._sock.settimeout(timeout)
+
+    def gettimeout(self) -> Optional[float]:
+        return self._timeout
+
+    def _bound(self):
+        self._sock.settimeout(bounded_timeout(self._timeout, socket.timeout))
+
+    def recv(self, *args):
+        self._bound()
+        return self._sock.recv(*args)
+
+    def recv_into(self, *args):
+        self._bound()
+        return self._sock.recv_into(*args)
+
+    def send(self, *args):
+        self._bound()
+        return self._sock.send(*args)
+
+    def sendall(self, *args):
+        self._bound()
+        return self._sock.sendall(*args)
+
+    def makefile(self, mode: str = 'r', *args, **kwargs):
+        # http.client通过makefile("rb")读取响应，读取需要经过包装层才能按截止时间收紧超时
+        if mode != 'rb':
+            return self._sock.makefile(mode, *args, **kwargs)
+        self._sock._io_refs += 1
+        return io.BufferedReader(socket.SocketIO(self, 'rb'), io.DEFAULT_BUFFER_SIZE)
+
+class DeadlineHTTPConnection(HTTPConnection):
+    def connect(self):
+        super().connect()
+        self.sock = DeadlineSocket(self.sock)
+
+class DeadlineHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        super().connect()
+        self.sock = DeadlineSocket(self.sock)
+
+class DeadlineHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = DeadlineHTTPConnection
+
+class DeadlineHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = DeadlineHTTPSConnection
+
+class DeadlineHTTPAdapter(HTTPAdapter):
+    """requests的连接适配器，连接池中的连接收发数据时受当前请求截止时间限制"""
+
+    pool_classes_by_scheme = {
+        'http': DeadlineHTTPConnectionPool,
+        'https': DeadlineHTTPSConnectionPool,
+    }
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self.pool_classes_by_scheme
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if not proxy.lower().startswith('socks'):
+            manager.pool_classes_by_scheme = self.pool_classes_by_scheme
+        return manager
@@ -15,6 +15,16 @@ class ModelConfig:
     top_p: Optional[float] = None
     frequency_penalty: Optional[float] = None
     presence_penalty: Optional[float] = None
+    parameter_grid: Optional[Dict[str, Any]] = None
+
+@dataclass
+class ModelPricing:
+    """模型价格，单位为每1k token的价格"""
+    input: float
+    output: float
+    
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return ((prompt_tokens or 0) * self.input + (completion_tokens or 0) * self.output) / 1000
 
 @dataclass
 class PlatformConfig:
@@ -24,12 +34,15 @@ class PlatformConfig:
     models: list[ModelConfig]
     base_url: Optional[str] = None
     secret_key: Optional[str] = None
+    timeout: Optional[float] = None
+    max_retries: Optional[int] = None
     
 class ConfigManager:
     def __init__(self, config_path: str = "config.yaml"):
         self.config_path = config_path
         self.config = None
         self.platforms = {}
+        self.pricing = {}
         self.load_config()
     
     def load_config(self):
@@ -41,10 +54,13 @@ class ConfigManager:
             self.config = yaml.safe_load(f)
         
         self._parse_platforms()
+        self._parse_pricing()
         logger.info(f"成功加载配置文件: {self.config_path}")
     
     def _parse_platforms(self):
         platforms_config = self.config.get('platforms', {})
+        default_timeout = self.config.get('test_settings', {}).get('timeout')
+        default_max_retries = self.config.get('test_settings', {}).get('max_retries')
         
         for platform_name, platform_data in platforms_config.items():
             if not platform_data.get('enabled', False):
@@ -58,7 +74,8 @@ class ConfigManager:
                     temperature=model_data.get('temperature', 0.7),
                     top_p=model_data.get('top_p'),
                     frequency_penalty=model_data.get('frequency_penalty'),
-                    presence_penalty=model_data.get('presence_penalty')
+                    presence_penalty=model_data.get('presence_penalty'),
+                    parameter_grid=model_data.get('parameter_grid')
                 ))
             
             self.platforms[platform_name] = PlatformConfig(
@@ -67,9 +84,24 @@ class ConfigManager:
                 api_key=platform_data.get('api_key', ''),
                 models=models,
                 base_url=platform_data.get('base_url'),
-                secret_key=platform_data.get('secret_key')
+                secret_key=platform_data.get('secret_key'),
+                timeout=platform_data.get('timeout', default_timeout),
+                max_retries=platform_data.get('max_retries', default_max_retries)
             )
     
+    def _parse_pricing(self):
+        pricing_config = self.config.get('pricing') or {}
+        
+        for platform_name, models in pricing_config.items():
+            for model_name, rates in (models or {}).items():
+                self.pricing[(platform_name, model_name)] = ModelPricing(
+                    input=float(rates.get('input', 0)),
+                    output=float(rates.get('output', 0))
+                )
+    
+    def get_model_pricing(self, platform: str, model: str) -> Optional[ModelPricing]:
+        return self.pricing.get((platform, model))
+    
     def get_platform_config(self, platform: str) -> Optional[PlatformConfig]:
         return self.platforms.get(platform)
     
@@ -81,6 +113,12 @@ class ConfigManager:
     
     def get_test_settings(self) -> Dict[str, Any]:
         return self.config.get('test_settings', {})
+    
+    def get_evaluation_settings(self) -> Dict[str, Any]:
+        return self.get_test_settings().get('evaluation', {}) or {}
+    
+    def get_matrix_settings(self) -> Dict[str, Any]:
+        return self.get_test_settings().get('matrix', {}) or {}
 
 if __name__ == "__main__":
     config = ConfigManager()
@@ -0,0 +1,331 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 在子进程中执行模型生成的代码：从stdin读取代码和测试用例，把结果以JSON写到stdout
+PYTHON_HARNESS = r'''
+import json, sys, types
+payload = json.loads(sys.stdin.read())
+namespace = {"__name__": "__solution__"}
+try:
+    exec(compile(payload["code"], "<solution>", "exec"), namespace)
+except BaseException as e:
+    print(json.dumps({"error": "代码执行失败: %s: %s" % (type(e).__name__, e)}))
+    sys.exit(0)
+
+name = payload.get("function")
+if name:
+    func = namespace.get(name)
+else:
+    funcs = [v for v in namespace.values()
+             if isinstance(v, types.FunctionType) and v.__code__.co_filename == "<solution>"]
+    func = funcs[0] if funcs else None
+if not callable(func):
+    print(json.dumps({"error": "未找到可调用的函数: %s" % (name or "")}))
+    sys.exit(0)
+
+results = []
+for case in payload["tests"]:
+    try:
+        value = func(*case.get("args", []), **case.get("kwargs", {}))
+        if isinstance(value, (types.GeneratorType, range, tuple)):
+            value = list(value)
+        expected = case.get("expected")
+        results.append(value == expected or json.loads(json.dumps(value, default=str)) == expected)
+    except BaseException:
+        results.append(False)
+print(json.dumps({"results": results}))
+'''
+
+CODE_BLOCK_PATTERN = re.compile(r"```(?:python|py)?[^\n]*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+
+def extract_python_code(response: str) -> str:
+    """提取回答中的Python代码块，没有代码块时把整段回答当作代码"""
+    blocks = CODE_BLOCK_PATTERN.findall(response or "")
+    if blocks:
+        return "\n\n".join(blocks)
+    return response or ""
+
+# 在新的mount/网络/PID命名空间中以root身份运行：搭建只读的最小根文件系统后chroot，
+# 切换到nobody用户并设置资源限制，最后exec执行PYTHON_HARNESS
+SANDBOX_LAUNCHER = r'''
+import ctypes, json, os, resource, sys
+config = json.loads(sys.argv[1])
+libc = ctypes.CDLL(None, use_errno=True)
+MS_RDONLY, MS_NOSUID, MS_NODEV, MS_REMOUNT, MS_BIND, MS_REC, MS_PRIVATE = 1, 2, 4, 32, 4096, 16384, 1 << 18
+
+def mount(source, target, fstype, flags, data=None):
+    encode = lambda value: value.encode() if value else None
+    if libc.mount(encode(source), encode(target), encode(fstype), flags, encode(data)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), target)
+
+try:
+    root = config["root"]
+    mount(None, "/", None, MS_REC | MS_PRIVATE)
+    mount("tmpfs", root, "tmpfs", MS_NOSUID | MS_NODEV, "size=1m,mode=755")
+    for path in config["binds"]:
+        target = root + path
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.islink(path):
+            os.symlink(os.readlink(path), target)
+            continue
+        os.makedirs(target, exist_ok=True)
+        mount(path, target, None, MS_BIND | MS_REC)
+        mount(None, target, None, MS_BIND | MS_REMOUNT | MS_RDONLY | MS_NOSUID | MS_NODEV)
+    os.makedirs(root + "/tmp")
+    mount("tmpfs", root + "/tmp", "tmpfs", MS_NOSUID | MS_NODEV, "size=%dm,mode=1777" % config["tmp_mb"])
+    mount(None, root, None, MS_REMOUNT | MS_RDONLY | MS_NOSUID | MS_NODEV)
+    os.chroot(root)
+    os.chdir("/tmp")
+
+    memory = config["memory_mb"] * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_CPU, (config["cpu_seconds"], config["cpu_seconds"]))
+    if config["uid"] is not None:
+        os.setgroups([])
+        os.setgid(config["uid"])
+        os.setuid(config["uid"])
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+except Exception as e:
+    print(json.dumps({"sandbox_error": "%s: %s" % (type(e).__name__, e)}))
+    sys.exit(0)
+
+os.execve(config["python"], [config["python"], "-I", "-c", config["harness"]], {})
+'''
+
+# 沙箱内切换到的用户(nobody)
+SANDBOX_UID = 65534
+
+def _interpreter_paths() -> List[str]:
+    """运行Python解释器需要以只读方式挂载进沙箱的目录，其余路径（包括配置文件和API密钥）在沙箱内不可见"""
+    candidates = ['/usr', '/bin', '/lib', '/lib32', '/lib64', '/libx32']
+    executable = os.path.abspath(sys.executable)
+    candidates += [os.path.dirname(executable), os.path.dirname(os.path.realpath(executable))]
+    candidates += [os.path.realpath(sys.prefix), os.path.realpath(sys.base_prefix)]
+
+    paths = []
+    for path in sorted(set(candidates), key=len):
+        if not os.path.lexists(path):
+            continue
+        if any(path == bound or path.startswith(bound.rstrip('/') + '/') for bound in paths):
+            continue
+        paths.append(path)
+    return paths
+
+def sandbox_command(root: str, memory_mb: int, cpu_seconds: int, tmp_mb: int = 64) -> Optional[List[str]]:
+    """生成在隔离环境中运行PYTHON_HARNESS的命令，当前系统不支持时返回None
+
+    使用util-linux的unshare创建新的mount、网络、PID、IPC和UTS命名空间：没有网络，
+    根文件系统只包含解释器所需的只读目录和一个内存中的/tmp，以nobody用户运行。
+    非root用户运行时借助用户命名空间获得挂载权限，代码以映射到当前用户的身份运行。
+    """
+    unshare = shutil.which('unshare')
+    if not sys.platform.startswith('linux') or unshare is None:
+        return None
+
+    command = [unshare, '--mount', '--net', '--pid', '--ipc', '--uts', '--fork', '--kill-child']
+    is_root = os.geteuid() == 0
+    if not is_root:
+        command.append('--map-root-user')
+
+    config = {
+        'root': root,
+        'binds': _interpreter_paths(),
+        'python': os.path.abspath(sys.executable),
+        'harness': PYTHON_HARNESS,
+        'memory_mb': memory_mb,
+        'cpu_seconds': cpu_seconds,
+        'tmp_mb': tmp_mb,
+        'uid': SANDBOX_UID if is_root else None
+    }
+    return command + [sys.executable, '-I', '-c', SANDBOX_LAUNCHER, json.dumps(config)]
+
+def evaluate_python(response: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """在隔离环境中执行回答里的代码并运行测试用例
+
+    会执行模型生成的任意代码，只能在EvaluationPipeline开启allow_code_execution后使用。
+    隔离环境见sandbox_command，当前系统无法提供隔离时不执行代码，得分为空。
+    """
+    tests = spec.get('tests') or []
+    if not tests:
+        return {'score': None, 'detail': '未配置测试用例'}
+
+    payload = json.dumps({
+        'code': extract_python_code(response),
+        'function': spec.get('function'),
+        'tests': tests
+    }, ensure_ascii=False)
+    timeout = spec.get('timeout', 10)
+
+    with tempfile.TemporaryDirectory() as root:
+        command = sandbox_command(root, spec.get('memory_mb', 512), int(timeout) + 1)
+        if command is None:
+            return {'score': None, 'detail': '当前系统无法提供代码执行的隔离环境(需要Linux和util-linux的unshare)'}
+        try:
+            completed = subprocess.run(
+                command, input=payload, capture_output=True, text=True, timeout=timeout, env={}
+            )
+        except subprocess.TimeoutExpired:
+            return {'score': 0.0, 'passed': 0, 'total': len(tests), 'detail': f'执行超时(>{timeout}s)'}
+
+    try:
+        output = json.loads(completed.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        stderr = completed.stderr.strip()
+        if stderr.startswith('unshare:'):
+            return {'score': None, 'detail': f'隔离环境启动失败: {stderr[-200:]}'}
+        return {'score': 0.0, 'passed': 0, 'total': len(tests),
+                'detail': f'执行异常: {stderr[-200:]}'}
+
+    if 'sandbox_error' in output:
+        return {'score': None, 'detail': f"隔离环境启动失败: {output['sandbox_error']}"}
+    if 'error' in output:
+        return {'score': 0.0, 'passed': 0, 'total': len(tests), 'detail': output['error']}
+
+    passed = sum(1 for ok in output['results'] if ok)
+    return {'score': passed / len(tests), 'passed': passed, 'total': len(tests),
+            'detail': f'通过{passed}/{len(tests)}个测试用例'}
+
+def evaluate_keywords(response: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """检查回答中包含的关键词比例"""
+    keywords = spec.get('keywords') or []
+    if not keywords:
+        return {'score': None, 'detail': '未配置关键词'}
+    text = response or ""
+    if not spec.get('case_sensitive', False):
+        text = text.lower()
+        keywords = [k.lower() for k in keywords]
+    matched = [k for k in keywords if k in text]
+    return {'score': len(matched) / len(keywords), 'passed': len(matched), 'total': len(keywords),
+            'detail': f"命中关键词: {', '.join(matched)}" if matched else '未命中关键词'}
+
+def evaluate_regex(response: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """检查回答匹配的正则表达式比例"""
+    patterns = spec.get('patterns') or ([spec['pattern']] if spec.get('pattern') else [])
+    if not patterns:
+        return {'score': None, 'detail': '未配置正则表达式'}
+    flags = 0 if spec.get('case_sensitive', False) else re.IGNORECASE
+    matched = sum(1 for p in patterns if re.search(p, response or "", flags | re.DOTALL))
+    return {'score': matched / len(patterns), 'passed': matched, 'total': len(patterns),
+            'detail': f'匹配{matched}/{len(patterns)}个正则'}
+
+EVALUATORS: Dict[str, Callable[[str, Dict[str, Any]], Dict[str, Any]]] = {
+    'python': evaluate_python,
+    'keywords': evaluate_keywords,
+    'regex': evaluate_regex,
+}
+
+# 会执行模型生成代码的评估类型，只有开启allow_code_execution后才会运行
+CODE_EXECUTION_EVALUATORS = {'python'}
+
+def register_evaluator(name: str, func: Callable[[str, Dict[str, Any]], Dict[str, Any]],
+                       executes_code: bool = False):
+    """注册自定义评估器，func需为模块级函数，以便按引用传给评估进程
+
+    评估器会执行回答中的代码时需传入executes_code=True，与python评估器一样默认不运行。
+    """
+    EVALUATORS[name] = func
+    if executes_code:
+        CODE_EXECUTION_EVALUATORS.add(name)
+    else:
+        CODE_EXECUTION_EVALUATORS.discard(name)
+
+def run_evaluation(response: str, spec: Dict[str, Any],
+                   evaluator: Optional[Callable[[str, Dict[str, Any]], Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """在进程池中执行的入口
+
+    evaluator由主进程按类型解析后传入。spawn方式启动的评估进程只会重新导入模块，
+    看不到主进程运行时注册的评估器，不能在子进程中按名称查找。
+    """
+    if evaluator is None:
+        evaluator = EVALUATORS.get(spec.get('type'))
+    if evaluator is None:
+        return {'score': None, 'detail': f"未知的评估类型: {spec.get('type')}"}
+    try:
+        return evaluator(response, spec)
+    except Exception as e:
+        return {'score': None, 'detail': f'评估失败: {str(e)}'}
+
+class EvaluationPipeline:
+    """回答评估流水线
+
+    测试过程中每拿到一个成功的回答就提交到进程池评估，与后续的API调用并行进行。
+    正在评估的任务数超过max_pending时submit会阻塞，避免积压过多回答占用内存。
+    评估规则优先使用提示词自身的evaluation配置，其次使用按类别配置的默认规则。
+    执行代码的评估（如python）需要在settings中设置allow_code_execution: true，否则跳过。
+    """
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.category_specs: Dict[str, Dict[str, Any]] = settings.get('categories') or {}
+        self.max_workers = settings.get('max_workers') or os.cpu_count() or 1
+        self.max_pending = settings.get('max_pending') or self.max_workers * 4
+        self.allow_code_execution = bool(settings.get('allow_code_execution', False))
+        self._skipped_code_execution = False
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._pending: List[tuple] = []
+
+    def resolve_spec(self, category: str, spec: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        return spec or self.category_specs.get(category)
+
+    def submit(self, result, category: str, spec: Optional[Dict[str, Any]] = None) -> bool:
+        """提交一个测试结果进行评估，drain()之后结果上会带有score和evaluation字段"""
+        spec = self.resolve_spec(category, spec)
+        if not spec or not result.success:
+            return False
+
+        if spec.get('type') in CODE_EXECUTION_EVALUATORS and not self.allow_code_execution:
+            if not self._skipped_code_execution:
+                logger.warning("评估规则需要执行模型生成的代码，未开启allow_code_execution，已跳过")
+                self._skipped_code_execution = True
+            result.evaluation = {'score': None, 'detail': '未开启allow_code_execution，跳过代码执行评估'}
+            result.score = None
+            return False
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        self._slots.acquire()
+        future = self._executor.submit(run_evaluation, result.response, spec, EVALUATORS.get(spec.get('type')))
+        future.add_done_callback(lambda _: self._slots.release())
+        self._pending.append((future, result))
+        return True
+
+    def drain(self):
+        """等待所有已提交的评估完成，并把评估结果写回对应的测试结果"""
+        for future, result in self._pending:
+            if future.cancelled():
+                evaluation = {'score': None, 'detail': '评估已取消'}
+            else:
+                try:
+                    evaluation = future.result()
+                except Exception as e:
+                    evaluation = {'score': None, 'detail': f'评估失败: {str(e)}'}
+            result.evaluation = evaluation
+            result.score = evaluation.get('score')
+        self._pending.clear()
+
+    def close(self, cancel: bool = False):
+        """关闭进程池并把评估结果写回测试结果
+
+        cancel为True时（测试被中断或出错）取消尚未开始的评估，只等待正在运行的评估结束，
+        已完成的得分仍会写回。
+        """
+        if cancel and self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+        self.drain()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
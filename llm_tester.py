@@ -1,7 +1,8 @@
+import argparse
 import asyncio
 import json
 import os
-from datetime import datetime
+import time
 from typing import List, Dict, Any
 import pandas as pd
 from rich.console import Console
@@ -12,7 +13,13 @@ from rich import print as rprint
 import logging
 
 from config_manager import ConfigManager
-from api_clients import APIClientFactory, APIResponse
+from api_clients import APIClientFactory, APIResponse, Cassette
+from matrix_planner import MatrixPlanner
+from results_db import ResultsDatabase, new_run_id
+from profiler import get_profiler, enable_profiling, section
+from tracing import get_tracer, enable_tracing
+from evaluators import EvaluationPipeline
+from response_store import ResponseStore
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,7 +33,19 @@ class LLMTester:
         self.config_manager = ConfigManager(config_path)
         self.clients = {}
         self.results = []
+        self.run_id = None
+        self.cassette = None
+        if self.config_manager.get_test_settings().get('trace', False):
+            enable_tracing()
         self._initialize_clients()
+        
+        cassette_settings = self.config_manager.get_test_settings().get('cassette') or {}
+        if cassette_settings.get('mode'):
+            self.use_cassette(
+                cassette_settings.get('path', 'results/cassette.db'),
+                cassette_settings['mode'],
+                cassette_settings.get('time_scale', 1.0)
+            )
     
     def _initialize_clients(self):
         """初始化所有启用的平台客户端"""
@@ -39,79 +58,111 @@ class LLMTester:
             else:
                 self.console.print(f"[red]✗[/red] 初始化{platform_name}客户端失败")
     
-    def test_single_model(self, platform_name: str, model_config, prompt: str) -> APIResponse:
+    def use_cassette(self, path: str, mode: str, time_scale: float = 1.0):
+        """为所有客户端开启录制(record)或回放(replay)模式，替换已开启的cassette时先将其关闭"""
+        if mode == Cassette.RECORD:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        cassette = Cassette(path, mode, time_scale=time_scale)
+        if self.cassette is not None:
+            self.cassette.close()
+        self.cassette = cassette
+        for client in self.clients.values():
+            client.cassette = self.cassette
+        action = "录制" if mode == Cassette.RECORD else "回放"
+        self.console.print(f"[cyan]{action}模式[/cyan]: {path}")
+    
+    def test_single_model(self, platform_name: str, model_config, prompt: str,
+                          enqueued_ns: int = None) -> APIResponse:
         """测试单个模型"""
         client = self.clients.get(platform_name)
         if not client:
             logger.error(f"未找到{platform_name}客户端")
             return None
         
-        return client.test_model(prompt, model_config)
+        return client.test_model(prompt, model_config, enqueued_ns=enqueued_ns)
     
-    def run_tests(self, test_specific_platform: str = None, test_specific_model: str = None):
-        """运行所有测试"""
+    def run_tests(self, test_specific_platform: str = None, test_specific_model: str = None,
+                  planner: MatrixPlanner = None):
+        """运行所有测试
+        
+        planner为空时按配置中的参数网格构建测试矩阵；也可以传入自定义的MatrixPlanner
+        以使用额外的过滤条件或抽样设置。
+        """
         test_prompts = self.config_manager.get_test_prompts()
         
         if not test_prompts:
             self.console.print("[red]未找到测试提示词[/red]")
             return
         
-        total_tests = 0
-        platforms_to_test = [test_specific_platform] if test_specific_platform else self.clients.keys()
-        
-        for platform_name in platforms_to_test:
-            platform_config = self.config_manager.get_platform_config(platform_name)
-            if not platform_config:
-                continue
-            
-            models_to_test = platform_config.models
-            if test_specific_model:
-                models_to_test = [m for m in models_to_test if m.name == test_specific_model]
-            
-            total_tests += len(models_to_test) * len(test_prompts)
+        if planner is None:
+            platforms_to_test = [test_specific_platform] if test_specific_platform else list(self.clients.keys())
+            planner = MatrixPlanner(
+                self.config_manager,
+                platforms=platforms_to_test,
+                models=[test_specific_model] if test_specific_model else None
+            )
         
+        total_tests = planner.count()
         self.console.print(f"\n[bold]开始测试 - 总计{total_tests}个测试[/bold]\n")
         
-        with Progress(
-            SpinnerColumn(),
-            TextColumn("[progress.description]{task.description}"),
-            console=self.console
-        ) as progress:
-            for platform_name in platforms_to_test:
-                platform_config = self.config_manager.get_platform_config(platform_name)
-                if not platform_config:
-                    continue
-                
-                models_to_test = platform_config.models
-                if test_specific_model:
-                    models_to_test = [m for m in models_to_test if m.name == test_specific_model]
-                
-                for model_config in models_to_test:
-                    for prompt_data in test_prompts:
-                        prompt = prompt_data['prompt']
-                        category = prompt_data.get('category', 'general')
-                        
-                        task_desc = f"测试 {platform_name} - {model_config.name}"
+        evaluation_settings = self.config_manager.get_evaluation_settings()
+        pipeline = EvaluationPipeline(evaluation_settings) if evaluation_settings.get('enabled', True) else None
+        
+        interrupted = True
+        try:
+            with get_tracer().span("run", total_tests=total_tests), Progress(
+                SpinnerColumn(),
+                TextColumn("[progress.description]{task.description}"),
+                console=self.console
+            ) as progress:
+                for test_task in planner.iter_tasks():
+                    enqueued_ns = time.time_ns()
+                    platform_name = test_task.platform
+                    model_config = test_task.model_config
+                    params_desc = ", ".join(f"{k}={v}" for k, v in test_task.params.items())
+                    model_desc = f"{model_config.name} ({params_desc})" if params_desc else model_config.name
+                    
+                    task_desc = f"测试 {platform_name} - {model_desc}"
+                    with section("progress"):
                         task = progress.add_task(task_desc, total=1)
+                    
+                    result = self.test_single_model(platform_name, model_config, test_task.prompt, enqueued_ns)
+                    
+                    if result:
+                        result.category = test_task.category
+                        result.params = test_task.params
+                        self.results.append(result)
+                        if pipeline:
+                            pipeline.submit(result, test_task.category, test_task.evaluation)
                         
-                        result = self.test_single_model(platform_name, model_config, prompt)
-                        
-                        if result:
-                            result.category = category
-                            self.results.append(result)
-                            
+                        with section("console_print"):
                             if result.success:
                                 self.console.print(
-                                    f"[green]✓[/green] {platform_name} - {model_config.name} - "
+                                    f"[green]✓[/green] {platform_name} - {model_desc} - "
                                     f"响应时间: {result.latency:.2f}s"
                                 )
+                            elif result.timed_out:
+                                self.console.print(
+                                    f"[yellow]⏱[/yellow] {platform_name} - {model_desc} - "
+                                    f"超时: {result.latency:.2f}s"
+                                )
                             else:
                                 self.console.print(
-                                    f"[red]✗[/red] {platform_name} - {model_config.name} - "
+                                    f"[red]✗[/red] {platform_name} - {model_desc} - "
                                     f"错误: {result.error}"
                                 )
-                        
+                    
+                    with section("progress"):
                         progress.update(task, advance=1)
+            interrupted = False
+        finally:
+            # 测试被中断或出错时同样关闭评估进程池，取消尚未开始的评估，已完成的得分仍写回结果
+            if pipeline:
+                with self.console.status("等待回答评估完成..."):
+                    pipeline.close(cancel=interrupted)
+        
+        if self.cassette:
+            self.cassette.flush()
         
         self.console.print(f"\n[bold green]测试完成![/bold green]")
     
@@ -121,39 +172,123 @@ class LLMTester:
             self.console.print("[yellow]没有测试结果需要保存[/yellow]")
             return
         
-        results_dir = self.config_manager.get_test_settings().get('results_path', 'results/')
+        test_settings = self.config_manager.get_test_settings()
+        results_dir = test_settings.get('results_path', 'results/')
         os.makedirs(results_dir, exist_ok=True)
         
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        run_id = new_run_id()
+        self.run_id = run_id
+        
+        # 完整回答写入压缩的附属文件，主结果文件只保留预览
+        save_detailed = test_settings.get('save_detailed_responses', False)
+        preview_chars = test_settings.get('response_preview_chars', 200 if save_detailed else 500)
+        responses_file = None
+        if save_detailed:
+            with section("save_results.responses"):
+                responses_file = self._save_detailed_responses(results_dir, run_id, test_settings)
         
         # 保存JSON格式
-        json_file = os.path.join(results_dir, f'test_results_{timestamp}.json')
+        json_file = os.path.join(results_dir, f'test_results_{run_id}.json')
+        with section("save_results.serialize"):
+            results_data = self._serialize_results(run_id, preview_chars)
+        
+        with section("save_results.json"), open(json_file, 'w', encoding='utf-8') as f:
+            json.dump(results_data, f, ensure_ascii=False, separators=(',', ':'))
+        
+        # 保存CSV格式
+        csv_file = None
+        if test_settings.get('save_csv', True):
+            csv_file = os.path.join(results_dir, f'test_results_{run_id}.csv')
+            with section("save_results.dataframe"):
+                df = pd.DataFrame(results_data)
+                df.to_csv(csv_file, index=False, encoding='utf-8')
+        
+        self.console.print(f"\n[green]结果已保存:[/green]")
+        self.console.print(f"  - JSON: {json_file}")
+        if csv_file:
+            self.console.print(f"  - CSV: {csv_file}")
+        if responses_file:
+            self.console.print(f"  - 完整回答: {responses_file}")
+        
+        # 追加写入结果库
+        if test_settings.get('save_to_database', True):
+            db_path = test_settings.get('results_db') or os.path.join(results_dir, 'results.db')
+            started_at = min((r.timestamp for r in self.results if r.timestamp), default=None)
+            with section("save_results.database"):
+                db = ResultsDatabase(db_path)
+                try:
+                    db.append_run(run_id, results_data, started_at=started_at)
+                finally:
+                    db.close()
+            self.console.print(f"  - 结果库: {db_path} (运行ID: {run_id})")
+    
+    def _save_detailed_responses(self, results_dir: str, run_id: str, test_settings: Dict[str, Any]) -> str:
+        """逐条写入完整回答（以及可选的原始响应），按结果ID建立偏移索引"""
+        save_raw = test_settings.get('save_raw_responses', False)
+        store = ResponseStore.create(results_dir, run_id, test_settings.get('response_compression', 'auto'))
+        try:
+            for i, r in enumerate(self.results):
+                record = {'response': r.response}
+                if save_raw:
+                    record['raw_response'] = r.raw_response
+                store.write(f"{run_id}-{i}", record)
+        finally:
+            store.close()
+        return store.data_path
+    
+    def _serialize_results(self, run_id: str, preview_chars: int = 500) -> List[Dict[str, Any]]:
+        """将测试结果转换为可保存的字典"""
         results_data = []
-        for r in self.results:
+        for i, r in enumerate(self.results):
             result_dict = {
+                'result_id': f"{run_id}-{i}",
                 'platform': r.platform,
                 'model': r.model,
                 'prompt': r.prompt,
-                'response': r.response[:500],  # 仅保存前500个字符
+                'response': r.response[:preview_chars],  # 仅保存回答预览，完整回答见detailed responses
                 'usage': r.usage,
                 'latency': r.latency,
+                'timestamp': r.timestamp,
                 'success': r.success,
+                'timed_out': r.timed_out,
                 'error': r.error,
-                'category': getattr(r, 'category', 'general')
+                'score': getattr(r, 'score', None),
+                'evaluation': getattr(r, 'evaluation', None),
+                'category': getattr(r, 'category', 'general'),
+                'params': getattr(r, 'params', {})
             }
             results_data.append(result_dict)
+        return results_data
+    
+    def save_trace(self):
+        """保存请求时间线（Chrome trace和OTLP JSON），与测试结果放在同一目录"""
+        tracer = get_tracer()
+        if not tracer.enabled or not tracer.spans:
+            return
         
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(results_data, f, ensure_ascii=False, indent=2)
+        results_dir = self.config_manager.get_test_settings().get('results_path', 'results/')
+        tag = self.run_id or new_run_id()
+        chrome_file, otlp_file = tracer.write(results_dir, tag)
         
-        # 保存CSV格式
-        csv_file = os.path.join(results_dir, f'test_results_{timestamp}.csv')
-        df = pd.DataFrame(results_data)
-        df.to_csv(csv_file, index=False, encoding='utf-8')
+        self.console.print(f"\n[green]请求时间线已保存:[/green]")
+        self.console.print(f"  - Chrome trace(Perfetto): {chrome_file}")
+        self.console.print(f"  - OTLP JSON: {otlp_file}")
+    
+    def save_profile(self):
+        """保存工具开销剖析结果（折叠栈和区段耗时表），与测试结果放在同一目录"""
+        profiler = get_profiler()
+        if not profiler.enabled:
+            return
         
-        self.console.print(f"\n[green]结果已保存:[/green]")
-        self.console.print(f"  - JSON: {json_file}")
-        self.console.print(f"  - CSV: {csv_file}")
+        results_dir = self.config_manager.get_test_settings().get('results_path', 'results/')
+        tag = self.run_id or new_run_id()
+        folded_file, sections_file = profiler.write(results_dir, tag)
+        
+        self.console.print("\n")
+        self.console.print(profiler.section_table())
+        self.console.print(f"\n[green]剖析结果已保存:[/green]")
+        self.console.print(f"  - 折叠栈(flamegraph): {folded_file}")
+        self.console.print(f"  - 区段耗时: {sections_file}")
     
     def display_summary(self):
         """显示测试摘要"""
@@ -167,10 +302,11 @@ class LLMTester:
         table.add_column("成功率", justify="center")
         table.add_column("平均响应时间(s)", justify="right")
         table.add_column("平均Token消耗", justify="right")
+        table.add_column("平均成本/请求", justify="right")
         
         # 按平台和模型分组统计
         from collections import defaultdict
-        stats = defaultdict(lambda: {'success': 0, 'total': 0, 'latency': [], 'tokens': []})
+        stats = defaultdict(lambda: {'success': 0, 'total': 0, 'latency': [], 'tokens': [], 'cost': []})
         
         for result in self.results:
             key = (result.platform, result.model)
@@ -180,24 +316,50 @@ class LLMTester:
                 stats[key]['latency'].append(result.latency)
                 if result.usage and 'total_tokens' in result.usage:
                     stats[key]['tokens'].append(result.usage['total_tokens'])
+                pricing = self.config_manager.get_model_pricing(result.platform, result.model)
+                if pricing and result.usage:
+                    stats[key]['cost'].append(pricing.cost(
+                        result.usage.get('prompt_tokens', 0),
+                        result.usage.get('completion_tokens', 0)
+                    ))
         
         for (platform, model), data in stats.items():
             success_rate = f"{(data['success'] / data['total']) * 100:.1f}%"
             avg_latency = sum(data['latency']) / len(data['latency']) if data['latency'] else 0
             avg_tokens = sum(data['tokens']) / len(data['tokens']) if data['tokens'] else 0
+            avg_cost = f"{sum(data['cost']) / len(data['cost']):.5f}" if data['cost'] else "N/A"
             
             table.add_row(
                 platform,
                 model,
                 success_rate,
                 f"{avg_latency:.2f}",
-                f"{avg_tokens:.0f}"
+                f"{avg_tokens:.0f}",
+                avg_cost
             )
         
         self.console.print("\n")
         self.console.print(table)
 
 def main():
+    parser = argparse.ArgumentParser(description="LLM API 测试工具")
+    parser.add_argument("--profile", action="store_true",
+                        help="剖析测试工具自身的开销（也可设置环境变量LLM_TEST_PROFILE=1）")
+    parser.add_argument("--trace", action="store_true",
+                        help="导出每个请求的时间线（也可设置环境变量LLM_TEST_TRACE=1）")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", metavar="PATH", help="录制所有API调用到cassette文件")
+    cassette_group.add_argument("--replay", metavar="PATH", help="从cassette文件回放API调用，不发起真实请求")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="回放时的耗时缩放比例，0表示不等待（默认1.0，即原始耗时）")
+    args = parser.parse_args()
+    
+    if args.profile:
+        enable_profiling()
+    if args.trace:
+        enable_tracing()
+    profiler = get_profiler()
+    
     console = Console()
     
     # 显示欢迎信息
@@ -215,9 +377,18 @@ def main():
         return
     
     # 创建测试器
-    tester = LLMTester()
+    try:
+        tester = LLMTester()
+        if args.record:
+            tester.use_cassette(args.record, Cassette.RECORD)
+        elif args.replay:
+            tester.use_cassette(args.replay, Cassette.REPLAY, time_scale=args.time_scale)
+    except FileNotFoundError as e:
+        console.print(f"[red]错误: {str(e)}[/red]")
+        return
     
     # 运行测试
+    profiler.start()
     try:
         tester.run_tests()
         tester.display_summary()
@@ -227,6 +398,17 @@ def main():
     except Exception as e:
         console.print(f"\n[red]测试过程中出现错误: {str(e)}[/red]")
         logger.exception("测试失败")
+    finally:
+        # 中断或出错时同样保存请求时间线，停止采样并保存剖析结果
+        try:
+            tester.save_trace()
+        except Exception as e:
+            console.print(f"\n[red]保存请求时间线失败: {str(e)}[/red]")
+        profiler.stop()
+        try:
+            tester.save_profile()
+        except Exception as e:
+            console.print(f"\n[red]保存剖析结果失败: {str(e)}[/red]")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
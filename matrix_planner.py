@@ -0,0 +1,208 @@
+import hashlib
+import itertools
+import random
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import logging
+
+from config_manager import ConfigManager, ModelConfig
+
+logger = logging.getLogger(__name__)
+
+# 允许在参数网格中展开的ModelConfig字段
+GRID_PARAMETERS = ('max_tokens', 'temperature', 'top_p', 'frequency_penalty', 'presence_penalty')
+
+@dataclass
+class MatrixTask:
+    """测试矩阵中的单个测试任务"""
+    platform: str
+    model_config: ModelConfig
+    prompt: str
+    category: str = 'general'
+    params: Dict[str, Any] = field(default_factory=dict)
+    evaluation: Optional[Dict[str, Any]] = None
+
+    def get(self, name: str) -> Any:
+        """按字段名取值，供过滤规则和分层抽样使用"""
+        if name == 'platform':
+            return self.platform
+        if name == 'model':
+            return self.model_config.name
+        if name == 'prompt':
+            return self.prompt
+        if name == 'category':
+            return self.category
+        return getattr(self.model_config, name, None)
+
+    @property
+    def key(self) -> Tuple:
+        """任务的唯一标识（平台、模型、参数、提示词）"""
+        model_params = tuple(getattr(self.model_config, name) for name in GRID_PARAMETERS)
+        return (self.platform, self.model_config.name, model_params, self.prompt, self.category)
+
+class MatrixPlanner:
+    """测试矩阵规划器
+
+    按 平台 × 模型 × 参数网格 × 提示词 惰性展开测试任务。任务以生成器的形式逐个产出，
+    即使网格非常大也不会在内存中整体展开。
+    """
+
+    def __init__(self, config_manager: ConfigManager,
+                 platforms: Optional[List[str]] = None,
+                 models: Optional[List[str]] = None,
+                 categories: Optional[List[str]] = None,
+                 filters: Optional[List[Callable[[MatrixTask], bool]]] = None,
+                 matrix_settings: Optional[Dict[str, Any]] = None):
+        self.config_manager = config_manager
+        self.platforms = platforms
+        self.models = models
+        self.categories = categories
+        self.filters = list(filters or [])
+
+        if matrix_settings is None:
+            matrix_settings = config_manager.get_matrix_settings()
+        self.parameter_grid = self._normalize_grid(matrix_settings.get('parameter_grid') or {})
+        self.exclude = matrix_settings.get('exclude') or []
+        self.sample_rate = matrix_settings.get('sample_rate')
+        self.sample_per_stratum = matrix_settings.get('sample_per_stratum')
+        self.stratify_by = matrix_settings.get('stratify_by') or ['platform', 'model', 'category']
+        self.seed = matrix_settings.get('seed', 0)
+
+        self.evaluations: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.prompts = self._unique_prompts()
+
+    @staticmethod
+    def _normalize_grid(grid: Dict[str, Any]) -> Dict[str, list]:
+        """校验网格参数并去除每个维度上的重复取值"""
+        normalized = {}
+        for name, values in grid.items():
+            if name not in GRID_PARAMETERS:
+                raise ValueError(f"不支持的网格参数: {name}，可选: {', '.join(GRID_PARAMETERS)}")
+            if not isinstance(values, (list, tuple)):
+                values = [values]
+            normalized[name] = list(dict.fromkeys(values))
+        return normalized
+
+    def _unique_prompts(self) -> List[Tuple[str, str]]:
+        prompts = []
+        for prompt_data in self.config_manager.get_test_prompts():
+            category = prompt_data.get('category', 'general')
+            if self.categories and category not in self.categories:
+                continue
+            prompts.append((prompt_data['prompt'], category))
+            if prompt_data.get('evaluation'):
+                self.evaluations.setdefault((prompt_data['prompt'], category), prompt_data['evaluation'])
+        return list(dict.fromkeys(prompts))
+
+    def _model_axes(self, model_config: ModelConfig) -> Dict[str, list]:
+        """合并全局网格与模型自身的网格，模型级设置优先"""
+        axes = {name: [getattr(model_config, name)] for name in GRID_PARAMETERS}
+        axes.update(self.parameter_grid)
+        axes.update(self._normalize_grid(model_config.parameter_grid or {}))
+        return axes
+
+    def _iter_model_configs(self) -> Iterator[Tuple[str, ModelConfig, Dict[str, Any]]]:
+        """逐个产出展开后的(平台, 模型配置, 网格参数)组合
+
+        同一模型在配置中出现多次时，若某个组合已被之前的条目覆盖则跳过，
+        判断只依赖各条目的网格维度，不需要记录已产出的组合。
+        """
+        platforms = self.platforms if self.platforms is not None else self.config_manager.get_enabled_platforms()
+
+        for platform_name in platforms:
+            platform_config = self.config_manager.get_platform_config(platform_name)
+            if not platform_config:
+                continue
+
+            seen_axes: Dict[str, List[Dict[str, list]]] = {}
+            for model_config in platform_config.models:
+                if self.models and model_config.name not in self.models:
+                    continue
+
+                axes = self._model_axes(model_config)
+                earlier = seen_axes.setdefault(model_config.name, [])
+                grid_names = [name for name in GRID_PARAMETERS
+                              if name in self.parameter_grid or name in (model_config.parameter_grid or {})]
+
+                for combo in itertools.product(*(axes[name] for name in GRID_PARAMETERS)):
+                    values = dict(zip(GRID_PARAMETERS, combo))
+                    if any(all(values[name] in prev[name] for name in GRID_PARAMETERS) for prev in earlier):
+                        continue
+                    params = {name: values[name] for name in grid_names}
+                    yield platform_name, replace(model_config, **values), params
+
+                earlier.append(axes)
+
+    def _iter_all(self) -> Iterator[MatrixTask]:
+        for platform_name, model_config, params in self._iter_model_configs():
+            for prompt, category in self.prompts:
+                yield MatrixTask(
+                    platform=platform_name,
+                    model_config=model_config,
+                    prompt=prompt,
+                    category=category,
+                    params=params,
+                    evaluation=self.evaluations.get((prompt, category))
+                )
+
+    def _is_excluded(self, task: MatrixTask) -> bool:
+        for rule in self.exclude:
+            matched = True
+            for name, expected in rule.items():
+                expected = expected if isinstance(expected, (list, tuple)) else [expected]
+                if task.get(name) not in expected:
+                    matched = False
+                    break
+            if matched:
+                return True
+        return False
+
+    def _accept(self, task: MatrixTask) -> bool:
+        if self._is_excluded(task):
+            return False
+        return all(f(task) for f in self.filters)
+
+    def _hash_fraction(self, task: MatrixTask) -> float:
+        """根据任务标识计算[0, 1)内的稳定哈希值，用于可复现的流式抽样"""
+        digest = hashlib.sha1(f"{self.seed}:{task.key!r}".encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+    def iter_tasks(self) -> Iterator[MatrixTask]:
+        """惰性产出所有待执行的测试任务"""
+        tasks = (task for task in self._iter_all() if self._accept(task))
+
+        if self.sample_rate is not None:
+            tasks = (task for task in tasks if self._hash_fraction(task) < self.sample_rate)
+
+        if not self.sample_per_stratum:
+            yield from tasks
+            return
+
+        # 分层抽样：每层使用水塘抽样保留至多sample_per_stratum个任务，内存只与层数相关
+        rng = random.Random(self.seed)
+        reservoirs: Dict[Tuple, List[MatrixTask]] = {}
+        counts: Dict[Tuple, int] = {}
+        k = self.sample_per_stratum
+
+        for task in tasks:
+            stratum = tuple(task.get(name) for name in self.stratify_by)
+            reservoir = reservoirs.setdefault(stratum, [])
+            counts[stratum] = counts.get(stratum, 0) + 1
+            if len(reservoir) < k:
+                reservoir.append(task)
+            else:
+                j = rng.randrange(counts[stratum])
+                if j < k:
+                    reservoir[j] = task
+
+        for reservoir in reservoirs.values():
+            yield from reservoir
+
+    def __iter__(self) -> Iterator[MatrixTask]:
+        return self.iter_tasks()
+
+    def count(self) -> int:
+        """统计任务总数，不保留任务本身"""
+        if not (self.exclude or self.filters or self.sample_rate is not None or self.sample_per_stratum):
+            return sum(1 for _ in self._iter_model_configs()) * len(self.prompts)
+        return sum(1 for _ in self.iter_tasks())
@@ -0,0 +1,184 @@
+import contextlib
+import csv
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+import logging
+
+from rich.table import Table
+
+logger = logging.getLogger(__name__)
+
+# 设置该环境变量为1/true即可开启性能剖析
+PROFILE_ENV_VAR = "LLM_TEST_PROFILE"
+
+_NULL_SECTION = contextlib.nullcontext()
+
+class _Section:
+    """计时区段，使用perf_counter_ns累计耗时"""
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats: Dict[str, List[int]], name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        entry = self.stats.get(self.name)
+        if entry is None:
+            self.stats[self.name] = [1, elapsed, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+        return False
+
+class HarnessProfiler:
+    """测试工具自身开销的剖析器
+
+    - 采样剖析：后台线程按固定间隔采集所有线程的调用栈，输出flamegraph可用的折叠栈格式
+    - 区段计时：section()标记的热点代码段按名称累计调用次数和耗时
+
+    未开启时section()直接返回共享的空上下文，几乎没有额外开销。
+    """
+
+    def __init__(self, enabled: bool = False, interval: float = 0.005):
+        self.enabled = enabled
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.wall_time = 0.0
+        self._local = threading.local()
+        self._thread_stats: List[Dict[str, List[int]]] = []
+        self._stats_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._started_at = None
+
+    def section(self, name: str):
+        """标记一个热点代码段，用法: with profiler.section("name"): ..."""
+        if not self.enabled:
+            return _NULL_SECTION
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            stats = self._local.stats = {}
+            with self._stats_lock:
+                self._thread_stats.append(stats)
+        return _Section(stats, name)
+
+    def start(self):
+        if not self.enabled or self._sampler is not None:
+            return
+        self._stop_event.clear()
+        self._started_at = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profiler-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        if self._sampler is None:
+            return
+        self._stop_event.set()
+        self._sampler.join()
+        self._sampler = None
+        self.wall_time += time.perf_counter() - self._started_at
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def section_stats(self) -> Dict[str, Dict[str, float]]:
+        """汇总所有线程的区段统计"""
+        merged: Dict[str, List[int]] = {}
+        with self._stats_lock:
+            for stats in self._thread_stats:
+                for name, (count, total, peak) in list(stats.items()):
+                    entry = merged.setdefault(name, [0, 0, 0])
+                    entry[0] += count
+                    entry[1] += total
+                    entry[2] = max(entry[2], peak)
+
+        result = {}
+        for name, (count, total, peak) in sorted(merged.items(), key=lambda item: -item[1][1]):
+            result[name] = {
+                'count': count,
+                'total_ms': total / 1e6,
+                'avg_us': total / count / 1e3,
+                'max_ms': peak / 1e6,
+                'wall_pct': total / 1e9 / self.wall_time * 100 if self.wall_time else 0.0
+            }
+        return result
+
+    def section_table(self) -> Table:
+        table = Table(title="工具开销剖析")
+        table.add_column("区段", style="cyan")
+        table.add_column("次数", justify="right")
+        table.add_column("总耗时(ms)", justify="right")
+        table.add_column("平均(us)", justify="right")
+        table.add_column("最大(ms)", justify="right")
+        table.add_column("占总时长", justify="right")
+        for name, stats in self.section_stats().items():
+            table.add_row(
+                name,
+                str(stats['count']),
+                f"{stats['total_ms']:.2f}",
+                f"{stats['avg_us']:.1f}",
+                f"{stats['max_ms']:.2f}",
+                f"{stats['wall_pct']:.1f}%"
+            )
+        return table
+
+    def write(self, output_dir: str, tag: str) -> List[str]:
+        """保存折叠栈文件和区段统计，返回写入的文件路径"""
+        os.makedirs(output_dir, exist_ok=True)
+
+        folded_file = os.path.join(output_dir, f'profile_{tag}.folded')
+        with open(folded_file, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        sections_file = os.path.join(output_dir, f'profile_sections_{tag}.csv')
+        with open(sections_file, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['section', 'count', 'total_ms', 'avg_us', 'max_ms', 'wall_pct'])
+            for name, stats in self.section_stats().items():
+                writer.writerow([name, stats['count'], f"{stats['total_ms']:.3f}", f"{stats['avg_us']:.3f}",
+                                 f"{stats['max_ms']:.3f}", f"{stats['wall_pct']:.2f}"])
+
+        return [folded_file, sections_file]
+
+_profiler = HarnessProfiler(
+    enabled=os.environ.get(PROFILE_ENV_VAR, '').lower() in ('1', 'true', 'yes')
+)
+
+def get_profiler() -> HarnessProfiler:
+    return _profiler
+
+def enable_profiling(interval: Optional[float] = None) -> HarnessProfiler:
+    _profiler.enabled = True
+    if interval:
+        _profiler.interval = interval
+    return _profiler
+
+def section(name: str):
+    """在全局剖析器上标记热点代码段"""
+    return _profiler.section(name)
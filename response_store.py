@@ -0,0 +1,102 @@
+import gzip
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_EXTENSIONS = {'zstd': 'zst', 'gzip': 'gz'}
+
+def resolve_codec(codec: str = 'auto') -> str:
+    """auto时优先使用zstd，未安装zstandard则退回gzip"""
+    if codec == 'auto':
+        return 'zstd' if zstandard is not None else 'gzip'
+    if codec not in CODEC_EXTENSIONS:
+        raise ValueError(f"不支持的压缩格式: {codec}")
+    if codec == 'zstd' and zstandard is None:
+        raise ImportError("使用zstd压缩需要安装zstandard: pip install zstandard")
+    return codec
+
+class ResponseStore:
+    """完整回答的压缩存储
+
+    每条记录(完整回答和可选的原始响应)单独压缩成一帧，顺序追加写入数据文件，
+    结果ID到(偏移, 长度)的索引单独保存。多帧拼接后的文件仍是合法的gzip/zstd流，
+    可以直接用命令行工具解压查看；按结果ID读取时只需定位并解压对应的一帧。
+    """
+
+    def __init__(self, data_path: str, codec: str, mode: str = 'r'):
+        self.data_path = data_path
+        self.index_path = data_path + '.idx'
+        self.codec = codec
+        self.mode = mode
+        self._lock = threading.Lock()
+
+        if mode == 'w':
+            self.index: Dict[str, list] = {}
+            self._file = open(data_path, 'wb')
+            self._compressor = zstandard.ZstdCompressor(level=3) if codec == 'zstd' else None
+        else:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+            self._file = open(data_path, 'rb')
+            self._decompressor = zstandard.ZstdDecompressor() if codec == 'zstd' else None
+
+    @classmethod
+    def create(cls, results_dir: str, run_id: str, codec: str = 'auto') -> 'ResponseStore':
+        codec = resolve_codec(codec)
+        data_path = os.path.join(results_dir, f'responses_{run_id}.jsonl.{CODEC_EXTENSIONS[codec]}')
+        return cls(data_path, codec, mode='w')
+
+    @classmethod
+    def open(cls, results_dir: str, run_id: str) -> Optional['ResponseStore']:
+        """打开某次运行的回答存储，不存在时返回None"""
+        for codec, extension in CODEC_EXTENSIONS.items():
+            data_path = os.path.join(results_dir, f'responses_{run_id}.jsonl.{extension}')
+            if os.path.exists(data_path) and os.path.exists(data_path + '.idx'):
+                return cls(data_path, codec, mode='r')
+        return None
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == 'zstd':
+            return self._compressor.compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    def _decompress(self, frame: bytes) -> bytes:
+        if self.codec == 'zstd':
+            return self._decompressor.decompress(frame)
+        return gzip.decompress(frame)
+
+    def write(self, result_id: str, record: Dict[str, Any]):
+        """追加一条记录"""
+        line = json.dumps(record, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+        frame = self._compress(line)
+        with self._lock:
+            offset = self._file.tell()
+            self._file.write(frame)
+            self.index[result_id] = [offset, len(frame)]
+
+    def get(self, result_id: str) -> Optional[Dict[str, Any]]:
+        """按结果ID读取一条记录"""
+        location = self.index.get(result_id)
+        if location is None:
+            return None
+        offset, length = location
+        with self._lock:
+            self._file.seek(offset)
+            frame = self._file.read(length)
+        return json.loads(self._decompress(frame))
+
+    def close(self):
+        if self.mode == 'w':
+            self._file.flush()
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, separators=(',', ':'))
+        self._file.close()
@@ -5,15 +5,166 @@ from typing import List, Dict
 from rich.console import Console
 from rich.table import Table
 from rich import print as rprint
-from datetime import datetime
+from datetime import datetime, timedelta
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+from config_manager import ConfigManager
+from results_db import ResultsDatabase
+from result_charts import render_charts, latency_sample
+from response_store import ResponseStore
+
 class ResultAnalyzer:
-    def __init__(self, results_dir: str = "results/"):
+    def __init__(self, results_dir: str = "results/", db_path: str = None,
+                 config_path: str = "config.yaml", pricing: Dict = None):
         self.results_dir = results_dir
+        self.db_path = db_path or os.path.join(results_dir, 'results.db')
         self.console = Console()
         self.data = None
+        self._db = None
+        self._response_stores = {}
+        
+        # 价格表: (平台, 模型) -> ModelPricing
+        if pricing is None and os.path.exists(config_path):
+            pricing = ConfigManager(config_path).pricing
+        self.pricing = pricing or {}
+    
+    def get_database(self) -> ResultsDatabase:
+        """打开结果库，不存在时返回None"""
+        if self._db is None:
+            if not os.path.exists(self.db_path):
+                self.console.print(f"[red]结果库{self.db_path}不存在[/red]")
+                return None
+            self._db = ResultsDatabase(self.db_path)
+        return self._db
+    
+    def query_results(self, columns: List[str] = None, **filters) -> pd.DataFrame:
+        """从结果库按条件查询结果
+        
+        filters支持run_ids、platform、model、category、since、until、success，
+        since/until为Unix时间戳。
+        """
+        db = self.get_database()
+        if db is None:
+            return None
+        df = pd.DataFrame.from_records(list(db.query(columns=columns, **filters)), columns=columns)
+        for name in ('success', 'timed_out'):
+            if name in df.columns:
+                df[name] = df[name].astype(bool)
+        return df
+    
+    def load_response(self, result_id: str) -> Dict:
+        """按结果ID读取完整回答（及保存时开启的原始响应），没有保存时返回None"""
+        run_id = result_id.rpartition('-')[0]
+        if run_id not in self._response_stores:
+            self._response_stores[run_id] = ResponseStore.open(self.results_dir, run_id)
+        store = self._response_stores[run_id]
+        return store.get(result_id) if store is not None else None
+    
+    def load_run(self, run_id: str = None) -> pd.DataFrame:
+        """从结果库加载某次运行的结果，默认加载最近一次"""
+        db = self.get_database()
+        if db is None:
+            return None
+        
+        run_id = run_id or db.latest_run_id()
+        if run_id is None:
+            self.console.print("[red]结果库中没有测试记录[/red]")
+            return None
+        
+        df = self.query_results(run_ids=[run_id])
+        if df.empty:
+            self.console.print(f"[red]运行{run_id}没有结果记录[/red]")
+            return None
+        df['usage'] = [
+            {'prompt_tokens': p, 'completion_tokens': c, 'total_tokens': t}
+            if pd.notna(t) else {}
+            for p, c, t in zip(df['prompt_tokens'], df['completion_tokens'], df['total_tokens'])
+        ]
+        self.data = df
+        self.console.print(f"[green]已加载运行: {run_id}[/green]")
+        return self.data
+    
+    def latency_trend(self, model: str, platform: str = None, days: int = 30,
+                      percentile: float = 0.95) -> pd.DataFrame:
+        """统计某个模型最近若干天内每次运行的延迟分位数，超时的请求按实际耗时计入"""
+        since = (datetime.now() - timedelta(days=days)).timestamp()
+        df = self.query_results(
+            columns=['run_id', 'timestamp', 'latency', 'success', 'timed_out'],
+            model=model, platform=platform, since=since
+        )
+        if df is not None:
+            df = latency_sample(df)
+        if df is None or df.empty:
+            self.console.print(f"[yellow]最近{days}天没有{model}的成功或超时记录[/yellow]")
+            return df
+        
+        trend = df.groupby('run_id').agg(
+            time=('timestamp', 'min'),
+            count=('latency', 'size'),
+            p50=('latency', lambda x: x.quantile(0.5)),
+            pct=('latency', lambda x: x.quantile(percentile))
+        ).sort_values('time').reset_index()
+        pct_name = f"p{percentile * 100:g}"
+        trend = trend.rename(columns={'pct': pct_name})
+        
+        table = Table(title=f"{model} 延迟趋势 (最近{days}天)")
+        table.add_column("运行ID", style="cyan")
+        table.add_column("时间")
+        table.add_column("请求数", justify="right")
+        table.add_column("p50(s)", justify="right")
+        table.add_column(f"{pct_name}(s)", justify="right")
+        for _, row in trend.iterrows():
+            table.add_row(
+                row['run_id'],
+                datetime.fromtimestamp(row['time']).strftime('%Y-%m-%d %H:%M'),
+                str(row['count']),
+                f"{row['p50']:.2f}",
+                f"{row[pct_name]:.2f}"
+            )
+        self.console.print("\n")
+        self.console.print(table)
+        return trend
+    
+    def compare_runs(self, base_run: str, target_run: str) -> pd.DataFrame:
+        """对比两次运行中各模型的成功率和延迟变化"""
+        df = self.query_results(
+            columns=['run_id', 'platform', 'model', 'latency', 'success', 'timed_out'],
+            run_ids=[base_run, target_run]
+        )
+        if df is None or df.empty:
+            return df
+        
+        def summarize(group):
+            success = group[group['success']]
+            return pd.Series({
+                'success_rate': group['success'].mean() * 100,
+                'avg_latency': success['latency'].mean(),
+                'p95_latency': latency_sample(group)['latency'].quantile(0.95)
+            })
+        
+        stats = df.groupby(['platform', 'model', 'run_id']).apply(summarize).unstack('run_id')
+        
+        table = Table(title=f"运行对比: {base_run} → {target_run}")
+        table.add_column("平台", style="cyan")
+        table.add_column("模型", style="magenta")
+        table.add_column("成功率", justify="center")
+        table.add_column("平均响应时间(s)", justify="right")
+        table.add_column("p95响应时间(s)", justify="right")
+        for (platform, model), row in stats.iterrows():
+            cells = []
+            for metric, fmt in (('success_rate', "{:.1f}%"), ('avg_latency', "{:.2f}"), ('p95_latency', "{:.2f}")):
+                before = row.get((metric, base_run))
+                after = row.get((metric, target_run))
+                before_text = fmt.format(before) if pd.notna(before) else "N/A"
+                after_text = fmt.format(after) if pd.notna(after) else "N/A"
+                cells.append(f"{before_text} → {after_text}")
+            table.add_row(platform, model, *cells)
+        self.console.print("\n")
+        self.console.print(table)
+        return stats
     
     def load_latest_results(self) -> pd.DataFrame:
         """加载最新的测试结果"""
@@ -22,7 +173,8 @@ class ResultAnalyzer:
             return None
         
         # 查找最新的JSON文件
-        json_files = [f for f in os.listdir(self.results_dir) if f.endswith('.json')]
+        json_files = [f for f in os.listdir(self.results_dir)
+                      if f.startswith('test_results_') and f.endswith('.json')]
         if not json_files:
             self.console.print("[red]未找到测试结果文件[/red]")
             return None
@@ -96,8 +248,11 @@ class ResultAnalyzer:
         table.add_column("平台", style="cyan")
         table.add_column("模型", style="magenta")
         table.add_column("成功率", justify="center")
+        table.add_column("超时率", justify="center")
         table.add_column("平均响应时间(s)", justify="right")
+        table.add_column("p99响应时间(s)", justify="right")
         table.add_column("平均Token", justify="right")
+        table.add_column("平均得分", justify="right")
         
         # 按平台和模型分组
         grouped = self.data.groupby(['platform', 'model'])
@@ -107,24 +262,41 @@ class ResultAnalyzer:
             success_rate = len(success_data) / len(group) * 100
             avg_latency = success_data['latency'].mean() if not success_data.empty else 0
             
+            # 超时请求按实际耗时计入p99，避免尾延迟被低估
+            timeout_rate = (group['timed_out'] == True).sum() / len(group) * 100 if 'timed_out' in group.columns else 0
+            tail_data = latency_sample(group)
+            p99_latency = tail_data['latency'].quantile(0.99) if not tail_data.empty else 0
+            
             # 计算平均token
             tokens = []
             for usage in success_data['usage']:
                 if usage and 'total_tokens' in usage:
                     tokens.append(usage['total_tokens'])
             avg_tokens = sum(tokens) / len(tokens) if tokens else 0
+            avg_score = self._average_score(success_data)
             
             table.add_row(
                 platform,
                 model,
                 f"{success_rate:.1f}%",
+                f"{timeout_rate:.1f}%",
                 f"{avg_latency:.2f}",
-                f"{avg_tokens:.0f}"
+                f"{p99_latency:.2f}",
+                f"{avg_tokens:.0f}",
+                f"{avg_score:.2f}" if avg_score is not None else "N/A"
             )
         
         self.console.print("\n")
         self.console.print(table)
     
+    @staticmethod
+    def _average_score(data: pd.DataFrame):
+        """回答质量平均得分(0-1)，没有评估结果时返回None"""
+        if 'score' not in data.columns:
+            return None
+        scores = pd.to_numeric(data['score'], errors='coerce').dropna()
+        return scores.mean() if not scores.empty else None
+    
     def analyze_by_category(self):
         """按类别分析测试结果"""
         if self.data is None:
@@ -162,7 +334,123 @@ class ResultAnalyzer:
         self.console.print("\n")
         self.console.print(table)
     
-    def generate_report(self, output_file: str = None):
+    @staticmethod
+    def _token_counts(df: pd.DataFrame, name: str) -> pd.Series:
+        """从usage字典或结果库的token列中取出token数"""
+        if name in df.columns:
+            return df[name].fillna(0)
+        return df['usage'].apply(lambda u: u.get(name, 0) if isinstance(u, dict) else 0)
+    
+    def cost_analysis(self, show: bool = True) -> pd.DataFrame:
+        """计算各模型的成本和性价比，并找出 p95延迟 与 每美元吞吐 的帕累托前沿
+        
+        每美元吞吐 = 输出吞吐(tokens/s) / 每1k输出token成本，数值越大性价比越高。
+        未配置价格的模型不参与前沿计算。
+        """
+        if self.data is None:
+            self.load_latest_results()
+        
+        if self.data is None or self.data.empty:
+            return None
+        
+        success_data = self.data[self.data['success'] == True].copy()
+        if success_data.empty:
+            return None
+        
+        success_data['prompt_tokens'] = self._token_counts(success_data, 'prompt_tokens')
+        success_data['completion_tokens'] = self._token_counts(success_data, 'completion_tokens')
+        # p95按成功和超时的请求计算，超时请求按实际耗时计入
+        tail_latency = latency_sample(self.data).groupby(['platform', 'model'])['latency']
+        p95_latency = tail_latency.quantile(0.95)
+        
+        rows = []
+        for (platform, model), group in success_data.groupby(['platform', 'model']):
+            pricing = self.pricing.get((platform, model))
+            output_tokens = group['completion_tokens'].sum()
+            total_latency = group['latency'].sum()
+            tokens_per_sec = output_tokens / total_latency if total_latency > 0 else float('nan')
+            
+            if pricing:
+                total_cost = (group['prompt_tokens'].sum() * pricing.input + output_tokens * pricing.output) / 1000
+                cost_per_request = total_cost / len(group)
+                cost_per_1k_output = total_cost / output_tokens * 1000 if output_tokens else float('nan')
+                value = tokens_per_sec / cost_per_1k_output if cost_per_1k_output else float('nan')
+            else:
+                cost_per_request = cost_per_1k_output = value = float('nan')
+            
+            rows.append({
+                'platform': platform,
+                'model': model,
+                'requests': len(group),
+                'p95_latency': p95_latency[(platform, model)],
+                'tokens_per_sec': tokens_per_sec,
+                'cost_per_request': cost_per_request,
+                'cost_per_1k_output': cost_per_1k_output,
+                'tokens_per_sec_per_dollar': value
+            })
+        
+        costs = pd.DataFrame(rows)
+        costs['pareto'] = False
+        
+        # 帕累托前沿：按p95升序扫描，每美元吞吐严格高于之前所有模型的即为前沿点
+        priced = costs[costs['tokens_per_sec_per_dollar'].notna()].sort_values(
+            ['p95_latency', 'tokens_per_sec_per_dollar'], ascending=[True, False]
+        )
+        best_value = float('-inf')
+        for index, row in priced.iterrows():
+            if row['tokens_per_sec_per_dollar'] > best_value:
+                costs.loc[index, 'pareto'] = True
+                best_value = row['tokens_per_sec_per_dollar']
+        
+        if show:
+            table = Table(title="成本与性价比")
+            table.add_column("平台", style="cyan")
+            table.add_column("模型", style="magenta")
+            table.add_column("p95响应时间(s)", justify="right")
+            table.add_column("输出吞吐(tokens/s)", justify="right")
+            table.add_column("成本/请求", justify="right")
+            table.add_column("成本/1k输出token", justify="right")
+            table.add_column("每美元吞吐", justify="right")
+            table.add_column("帕累托前沿", justify="center")
+            
+            for _, row in costs.iterrows():
+                table.add_row(
+                    row['platform'],
+                    row['model'],
+                    f"{row['p95_latency']:.2f}",
+                    f"{row['tokens_per_sec']:.1f}",
+                    f"{row['cost_per_request']:.5f}" if pd.notna(row['cost_per_request']) else "N/A",
+                    f"{row['cost_per_1k_output']:.4f}" if pd.notna(row['cost_per_1k_output']) else "N/A",
+                    f"{row['tokens_per_sec_per_dollar']:.1f}" if pd.notna(row['tokens_per_sec_per_dollar']) else "N/A",
+                    "[green]★[/green]" if row['pareto'] else ""
+                )
+            
+            self.console.print("\n")
+            self.console.print(table)
+        
+        return costs
+    
+    def generate_charts(self, base_path: str = None, formats: tuple = ('png', 'svg'),
+                        max_workers: int = None) -> Dict[str, List[str]]:
+        """生成延迟CDF、小提琴图、吞吐量时间线和延迟-并发散点图
+        
+        base_path为输出文件名前缀，各图表保存为"{base_path}_{图表名}.{格式}"。
+        """
+        if self.data is None:
+            self.load_latest_results()
+        
+        if self.data is None or self.data.empty:
+            return {}
+        
+        if base_path is None:
+            base_path = os.path.join(self.results_dir, f"charts_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        
+        charts = render_charts(self.data, base_path, formats=formats, max_workers=max_workers)
+        for name, paths in charts.items():
+            self.console.print(f"[green]图表已保存: {', '.join(paths)}[/green]")
+        return charts
+    
+    def generate_report(self, output_file: str = None, with_charts: bool = True):
         """生成详细的分析报告"""
         if self.data is None:
             self.load_latest_results()
@@ -204,26 +492,57 @@ class ResultAnalyzer:
             platform_data = self.data[self.data['platform'] == platform]
             success_data = platform_data[platform_data['success'] == True]
             
+            avg_score = self._average_score(success_data)
             stats = {
                 '平台': platform,
                 '成功率': f"{len(success_data) / len(platform_data) * 100:.1f}%",
-                '平均响应时间': f"{success_data['latency'].mean():.2f}s" if not success_data.empty else "N/A"
+                '平均响应时间': f"{success_data['latency'].mean():.2f}s" if not success_data.empty else "N/A",
+                '平均得分': f"{avg_score:.2f}" if avg_score is not None else "N/A"
             }
             platform_stats.append(stats)
         
         df_platforms = pd.DataFrame(platform_stats)
         report += df_platforms.to_markdown(index=False) + "\n\n"
         
-        # 保存报告
-        if output_file:
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(report)
-            self.console.print(f"[green]报告已保存到: {output_file}[/green]")
-        else:
+        # 添加成本分析
+        costs = self.cost_analysis(show=False)
+        if costs is not None and costs['cost_per_request'].notna().any():
+            report += "## 成本与性价比\n\n"
+            cost_table = pd.DataFrame({
+                '平台': costs['platform'],
+                '模型': costs['model'],
+                'p95响应时间': costs['p95_latency'].map(lambda v: f"{v:.2f}s"),
+                '输出吞吐(tokens/s)': costs['tokens_per_sec'].map(lambda v: f"{v:.1f}"),
+                '成本/请求': costs['cost_per_request'].map(lambda v: f"{v:.5f}" if pd.notna(v) else "N/A"),
+                '成本/1k输出token': costs['cost_per_1k_output'].map(lambda v: f"{v:.4f}" if pd.notna(v) else "N/A"),
+                '每美元吞吐': costs['tokens_per_sec_per_dollar'].map(lambda v: f"{v:.1f}" if pd.notna(v) else "N/A"),
+                '帕累托前沿': costs['pareto'].map(lambda v: "★" if v else "")
+            })
+            report += cost_table.to_markdown(index=False) + "\n\n"
+            report += "每美元吞吐 = 输出吞吐 / 每1k输出token成本；帕累托前沿上的模型在p95延迟和性价比之间没有被其他模型同时超越。\n\n"
+        
+        if not output_file:
             output_file = os.path.join(self.results_dir, f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md")
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(report)
-            self.console.print(f"[green]报告已保存到: {output_file}[/green]")
+        
+        # 生成图表，与报告保存在同一目录
+        if with_charts:
+            charts = self.generate_charts(os.path.splitext(output_file)[0])
+            if charts:
+                report += "## 图表\n\n"
+                chart_titles = {
+                    'latency_cdf': '延迟CDF',
+                    'latency_violin': '延迟分布',
+                    'throughput_timeline': '吞吐量时间线',
+                    'latency_vs_concurrency': '延迟-并发'
+                }
+                for name, paths in charts.items():
+                    png = next((p for p in paths if p.endswith('.png')), paths[0])
+                    report += f"### {chart_titles.get(name, name)}\n\n![{name}]({os.path.basename(png)})\n\n"
+        
+        # 保存报告
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(report)
+        self.console.print(f"[green]报告已保存到: {output_file}[/green]")
         
         return report
 
@@ -242,6 +561,7 @@ def main():
     analyzer.compare_platforms()
     analyzer.compare_models()
     analyzer.analyze_by_category()
+    analyzer.cost_analysis()
     
     # 生成报告
     analyzer.generate_report()
@@ -0,0 +1,195 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Sequence
+import logging
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+logger = logging.getLogger(__name__)
+
+# 每个模型传给绘图进程的最大点数，超过时先做分位数压缩或抽样
+CDF_POINTS = 1000
+VIOLIN_POINTS = 5000
+SCATTER_POINTS = 20000
+TIMELINE_BINS = 200
+
+def _series_label(platform: str, model: str) -> str:
+    return f"{platform}/{model}"
+
+def _quantile_sample(values: np.ndarray, points: int) -> np.ndarray:
+    """用等间隔分位数压缩数据，保持分布形状且结果可复现"""
+    if len(values) <= points:
+        return np.sort(values)
+    return np.quantile(values, np.linspace(0, 1, points))
+
+def latency_sample(df: pd.DataFrame) -> pd.DataFrame:
+    """计算延迟分位数用的行：成功的请求加上超时的请求（按实际耗时计），避免尾延迟被低估"""
+    sample = df['success'] == True
+    if 'timed_out' in df.columns:
+        sample = sample | (df['timed_out'] == True)
+    return df[sample]
+
+def _completion_tokens(df: pd.DataFrame) -> np.ndarray:
+    if 'completion_tokens' in df.columns:
+        return df['completion_tokens'].fillna(0).to_numpy(dtype=float)
+    if 'usage' in df.columns:
+        return np.array([
+            (u or {}).get('completion_tokens', 0) if isinstance(u, dict) else 0
+            for u in df['usage']
+        ], dtype=float)
+    return np.zeros(len(df))
+
+def in_flight_at_start(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """计算每个请求开始时正在进行中的请求数（含自身）"""
+    sorted_starts = np.sort(starts)
+    sorted_ends = np.sort(ends)
+    started = np.searchsorted(sorted_starts, starts, side='right')
+    finished = np.searchsorted(sorted_ends, starts, side='right')
+    return started - finished
+
+def prepare_chart_data(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """在主进程中完成分组、分箱和降采样，只把小数组交给绘图进程"""
+    charts = {}
+    sample = latency_sample(df)
+    if sample.empty:
+        return charts
+
+    groups = [
+        (_series_label(platform, model), group['latency'].to_numpy(dtype=float))
+        for (platform, model), group in sample.groupby(['platform', 'model'])
+    ]
+    charts['latency_cdf'] = {
+        'series': [(label, _quantile_sample(values, CDF_POINTS), len(values)) for label, values in groups]
+    }
+    charts['latency_violin'] = {
+        'series': [(label, _quantile_sample(values, VIOLIN_POINTS)) for label, values in groups]
+    }
+
+    if 'timestamp' not in df.columns or df['timestamp'].isna().all():
+        return charts
+
+    timed = df[df['timestamp'].notna()]
+    starts = timed['timestamp'].to_numpy(dtype=float)
+    ends = starts + timed['latency'].to_numpy(dtype=float)
+    t0 = starts.min()
+
+    # 吞吐量时间线：按完成时间分箱统计每秒完成的请求数和输出token数
+    edges = np.linspace(0, max(ends.max() - t0, 1e-6), TIMELINE_BINS + 1)
+    width = edges[1] - edges[0]
+    timed_success = (timed['success'] == True).to_numpy()
+    tokens = _completion_tokens(timed)
+    timeline = []
+    for (platform, model), index in timed.groupby(['platform', 'model']).indices.items():
+        mask = timed_success[index]
+        finished = ends[index][mask] - t0
+        requests, _ = np.histogram(finished, bins=edges)
+        output_tokens, _ = np.histogram(finished, bins=edges, weights=tokens[index][mask])
+        timeline.append((_series_label(platform, model), requests / width, output_tokens / width))
+    charts['throughput_timeline'] = {'centers': (edges[:-1] + edges[1:]) / 2, 'series': timeline}
+
+    # 延迟-并发散点：并发数取请求开始时的在途请求数
+    concurrency = in_flight_at_start(starts, ends)
+    latency = timed['latency'].to_numpy(dtype=float)
+    if len(latency) > SCATTER_POINTS:
+        rng = np.random.default_rng(0)
+        picked = rng.choice(len(latency), SCATTER_POINTS, replace=False)
+        concurrency, latency, timed_success = concurrency[picked], latency[picked], timed_success[picked]
+    charts['latency_vs_concurrency'] = {
+        'concurrency': concurrency,
+        'latency': latency,
+        'success': timed_success
+    }
+    return charts
+
+def _plot_latency_cdf(ax, data):
+    for label, values, count in data['series']:
+        ax.plot(values, np.linspace(0, 1, len(values)), label=f"{label} (n={count})")
+    ax.set_xlabel("Latency (s)")
+    ax.set_ylabel("CDF")
+    ax.set_title("Latency CDF")
+    ax.grid(True, alpha=0.3)
+    ax.legend(fontsize='small')
+
+def _plot_latency_violin(ax, data):
+    labels = [label for label, _ in data['series']]
+    ax.violinplot([values for _, values in data['series']], showmedians=True)
+    ax.set_xticks(range(1, len(labels) + 1))
+    ax.set_xticklabels(labels, rotation=30, ha='right', fontsize='small')
+    ax.set_ylabel("Latency (s)")
+    ax.set_title("Latency distribution")
+    ax.grid(True, axis='y', alpha=0.3)
+
+def _plot_throughput_timeline(ax, data):
+    centers = data['centers']
+    for label, requests, _ in data['series']:
+        ax.plot(centers, requests, label=label)
+    ax.set_xlabel("Time since start (s)")
+    ax.set_ylabel("Completed requests / s")
+    ax.set_title("Throughput over time")
+    ax.grid(True, alpha=0.3)
+    ax.legend(fontsize='small')
+
+    tokens_ax = ax.twinx()
+    total_tokens = np.sum([tokens for _, _, tokens in data['series']], axis=0)
+    tokens_ax.plot(centers, total_tokens, color='gray', linestyle='--', alpha=0.6)
+    tokens_ax.set_ylabel("Output tokens / s (all models)")
+
+def _plot_latency_vs_concurrency(ax, data):
+    success = data['success']
+    ax.scatter(data['concurrency'][success], data['latency'][success], s=4, alpha=0.3, label="success")
+    if (~success).any():
+        ax.scatter(data['concurrency'][~success], data['latency'][~success], s=4, alpha=0.3,
+                   color='red', label="failed")
+    ax.set_xlabel("In-flight requests at start")
+    ax.set_ylabel("Latency (s)")
+    ax.set_title("Latency vs concurrency")
+    ax.grid(True, alpha=0.3)
+    ax.legend(fontsize='small')
+
+PLOTTERS = {
+    'latency_cdf': _plot_latency_cdf,
+    'latency_violin': _plot_latency_violin,
+    'throughput_timeline': _plot_throughput_timeline,
+    'latency_vs_concurrency': _plot_latency_vs_concurrency,
+}
+
+def render_chart(name: str, data: Dict[str, Any], base_path: str, formats: Sequence[str]) -> List[str]:
+    """绘制单张图表并按指定格式保存，在子进程中执行"""
+    fig, ax = plt.subplots(figsize=(10, 6))
+    try:
+        PLOTTERS[name](ax, data)
+        fig.tight_layout()
+        paths = []
+        for fmt in formats:
+            path = f"{base_path}_{name}.{fmt}"
+            fig.savefig(path, format=fmt, dpi=120)
+            paths.append(path)
+        return paths
+    finally:
+        plt.close(fig)
+
+def render_charts(df: pd.DataFrame, base_path: str, formats: Sequence[str] = ('png', 'svg'),
+                  max_workers: int = None) -> Dict[str, List[str]]:
+    """准备数据后在进程池中并行绘制全部图表，返回 图表名 -> 文件路径列表"""
+    charts = prepare_chart_data(df)
+    if not charts:
+        return {}
+
+    os.makedirs(os.path.dirname(base_path) or '.', exist_ok=True)
+    max_workers = max_workers or min(len(charts), os.cpu_count() or 1)
+    outputs = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(render_chart, name, data, base_path, tuple(formats))
+            for name, data in charts.items()
+        }
+        for name, future in futures.items():
+            try:
+                outputs[name] = future.result()
+            except Exception as e:
+                logger.error(f"绘制图表{name}失败: {str(e)}")
+    return outputs
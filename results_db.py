@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# results表中允许查询的列
+RESULT_COLUMNS = (
+    'id', 'run_id', 'timestamp', 'platform', 'model', 'category', 'prompt', 'response',
+    'latency', 'success', 'error', 'prompt_tokens', 'completion_tokens', 'total_tokens', 'params',
+    'timed_out', 'score', 'result_id'
+)
+
+# 旧版本结果库中缺少的列，打开时自动补齐
+ADDED_COLUMNS = {
+    'timed_out': 'INTEGER NOT NULL DEFAULT 0',
+    'score': 'REAL',
+    'result_id': 'TEXT',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    total INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    timestamp REAL,
+    platform TEXT NOT NULL,
+    model TEXT NOT NULL,
+    category TEXT,
+    prompt TEXT,
+    response TEXT,
+    latency REAL,
+    success INTEGER NOT NULL,
+    error TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    total_tokens INTEGER,
+    params TEXT,
+    timed_out INTEGER NOT NULL DEFAULT 0,
+    score REAL,
+    result_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_run_id ON results (run_id);
+CREATE INDEX IF NOT EXISTS idx_results_timestamp ON results (timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_platform_model ON results (platform, model, timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_model ON results (model, timestamp);
+CREATE INDEX IF NOT EXISTS idx_results_category ON results (category);
+"""
+
+def new_run_id() -> str:
+    """生成运行ID：秒级时间戳加毫秒和随机后缀，同一秒内保存的多次运行不会冲突，且仍按时间排序"""
+    now = datetime.now()
+    return f"{now:%Y%m%d_%H%M%S}_{now.microsecond // 1000:03d}{os.urandom(3).hex()}"
+
+class ResultsDatabase:
+    """基于SQLite的测试结果库
+
+    每次测试运行追加写入一批结果，已写入的记录不会被修改。按运行ID、时间、平台、
+    模型和类别建立索引，跨多次运行查询时只读取需要的行。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.conn.commit()
+    
+    def _migrate(self):
+        existing = {row['name'] for row in self.conn.execute("PRAGMA table_info(results)")}
+        for name, definition in ADDED_COLUMNS.items():
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE results ADD COLUMN {name} {definition}")
+
+    def append_run(self, run_id: str, results: Iterable[Dict[str, Any]], started_at: Optional[float] = None) -> int:
+        """追加一次运行的全部结果，返回写入的行数"""
+        rows = [self._to_row(run_id, r) for r in results]
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO runs (run_id, started_at, total) VALUES (?, ?, ?)",
+                (run_id, started_at if started_at is not None else time.time(), len(rows))
+            )
+            self.conn.executemany(
+                f"INSERT INTO results ({', '.join(RESULT_COLUMNS[1:])}) "
+                f"VALUES ({', '.join('?' * (len(RESULT_COLUMNS) - 1))})",
+                rows
+            )
+        logger.info(f"已写入结果库 {self.db_path}: 运行{run_id}, {len(rows)}条")
+        return len(rows)
+
+    @staticmethod
+    def _to_row(run_id: str, result: Dict[str, Any]) -> tuple:
+        usage = result.get('usage') or {}
+        params = result.get('params')
+        return (
+            run_id,
+            result.get('timestamp'),
+            result['platform'],
+            result['model'],
+            result.get('category'),
+            result.get('prompt'),
+            result.get('response'),
+            result.get('latency'),
+            1 if result.get('success') else 0,
+            result.get('error'),
+            usage.get('prompt_tokens'),
+            usage.get('completion_tokens'),
+            usage.get('total_tokens'),
+            json.dumps(params, ensure_ascii=False) if params else None,
+            1 if result.get('timed_out') else 0,
+            result.get('score'),
+            result.get('result_id')
+        )
+
+    def query(self, columns: Optional[List[str]] = None,
+              run_ids: Optional[List[str]] = None,
+              platform: Optional[str] = None,
+              model: Optional[str] = None,
+              category: Optional[str] = None,
+              since: Optional[float] = None,
+              until: Optional[float] = None,
+              success: Optional[bool] = None) -> Iterator[Dict[str, Any]]:
+        """按条件查询结果行，逐行产出字典"""
+        columns = list(columns or RESULT_COLUMNS)
+        unknown = [c for c in columns if c not in RESULT_COLUMNS]
+        if unknown:
+            raise ValueError(f"未知的结果列: {', '.join(unknown)}")
+
+        conditions, args = [], []
+        if run_ids:
+            conditions.append(f"run_id IN ({', '.join('?' * len(run_ids))})")
+            args.extend(run_ids)
+        for name, value in (('platform', platform), ('model', model), ('category', category)):
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                args.append(value)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            args.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            args.append(until)
+        if success is not None:
+            conditions.append("success = ?")
+            args.append(1 if success else 0)
+
+        sql = f"SELECT {', '.join(columns)} FROM results"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+
+        with self._lock:
+            rows = self.conn.execute(sql, args).fetchall()
+        for row in rows:
+            yield dict(row)
+
+    def list_runs(self, limit: Optional[int] = None, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """按开始时间倒序列出运行记录"""
+        sql = "SELECT run_id, started_at, total FROM runs"
+        args = []
+        if since is not None:
+            sql += " WHERE started_at >= ?"
+            args.append(since)
+        sql += " ORDER BY started_at DESC"
+        if limit:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            return [dict(row) for row in self.conn.execute(sql, args).fetchall()]
+
+    def latest_run_id(self) -> Optional[str]:
+        runs = self.list_runs(limit=1)
+        return runs[0]['run_id'] if runs else None
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,58 @@
+"""测试共用的本地替身服务和追踪器fixture"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tracing import get_tracer
+
+# 前两次请求返回429，之后正常返回
+RATE_LIMITED_REQUESTS = 2
+
+COMPLETION = {
+    "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-test",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+}
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests_seen = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        FlakyHandler.requests_seen += 1
+        if FlakyHandler.requests_seen <= RATE_LIMITED_REQUESTS:
+            status, body = 429, {"error": {"message": "rate limited", "type": "rate_limit"}}
+        else:
+            status, body = 200, COMPLETION
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Retry-After", "0.05")
+        self.end_headers()
+        self.wfile.write(data)
+
+@pytest.fixture
+def flaky_server():
+    FlakyHandler.requests_seen = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def tracer():
+    tracer = get_tracer()
+    enabled, spans = tracer.enabled, tracer.spans
+    tracer.enabled, tracer.spans = True, []
+    yield tracer
+    tracer.enabled, tracer.spans = enabled, spans
+
@@ -0,0 +1,37 @@
+"""录制与回放的测试：回放录制的错误时，重试行为应与录制时一致"""
+from api_clients import Cassette, OpenAIClient
+from config_manager import ModelConfig, PlatformConfig
+
+def make_client(base_url: str) -> OpenAIClient:
+    return OpenAIClient(PlatformConfig(
+        name="openai", enabled=True, api_key="sk-test", models=[], base_url=base_url, timeout=10, max_retries=2
+    ))
+
+def attempts(tracer):
+    return [span.attributes["attempt"] for span in sorted(
+        (span for span in tracer.spans if span.name == "attempt"), key=lambda span: span.start_ns
+    )]
+
+def test_replay_retries_recorded_rate_limits(flaky_server, tracer, tmp_path):
+    path = str(tmp_path / "cassette.db")
+    model = ModelConfig(name="gpt-test")
+
+    client = make_client(flaky_server)
+    client.cassette = Cassette(path, Cassette.RECORD)
+    recorded = client.test_model("ping", model)
+    client.cassette.close()
+    assert recorded.success
+    assert attempts(tracer) == [1, 2, 3]
+
+    # 回放不访问替身服务，同一个cassette回放两次都应在第三次尝试成功
+    client = make_client("http://127.0.0.1:9/v1")
+    client.cassette = Cassette(path, Cassette.REPLAY, time_scale=0)
+    try:
+        for _ in range(2):
+            tracer.spans = []
+            replayed = client.test_model("ping", model)
+            assert replayed.success, replayed.error
+            assert replayed.response == recorded.response
+            assert attempts(tracer) == [1, 2, 3]
+    finally:
+        client.cassette.close()
@@ -0,0 +1,102 @@
+"""通义千问客户端的并发压力测试
+
+本地用ThreadingHTTPServer模拟DashScope接口，把请求头中的api_key原样放进回答返回，
+并在每个新连接上等待一小段时间模拟TCP/TLS握手的开销。
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from api_clients import AlibabaClient
+from config_manager import ModelConfig, PlatformConfig
+
+# 每个新连接的模拟握手耗时（秒），与访问公网接口时TCP加TLS握手的量级相当
+CONNECT_COST = 0.1
+THREADS = 16
+CALLS_PER_CLIENT = 400
+
+class EchoKeyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        time.sleep(CONNECT_COST)
+        super().setup()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        key = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        body = json.dumps({
+            "output": {"choices": [{"message": {"content": key}}]},
+            "usage": {"input_tokens": 1, "output_tokens": 1, "total_tokens": 2}
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture(scope="module")
+def stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EchoKeyHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/api/v1"
+    server.shutdown()
+    server.server_close()
+
+def make_client(base_url: str, api_key: str) -> AlibabaClient:
+    return AlibabaClient(PlatformConfig(
+        name="alibaba", enabled=True, api_key=api_key, models=[], base_url=base_url, timeout=10, max_retries=0
+    ))
+
+def run_concurrently(calls, threads: int = THREADS) -> float:
+    """并发执行calls中的函数，返回每秒完成的调用数"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda call: call(), calls))
+    elapsed = time.perf_counter() - start
+    assert all(results)
+    return len(calls) / elapsed
+
+def test_api_keys_are_isolated_between_instances(stand_in):
+    clients = {key: make_client(stand_in, key) for key in ("key-a", "key-b")}
+    model = ModelConfig(name="qwen-turbo")
+    mismatches = []
+
+    def call(key):
+        def run():
+            response = clients[key].test_model("ping", model)
+            if not response.success or response.response != key:
+                mismatches.append((key, response.response, response.error))
+            return True
+        return run
+
+    calls = [call(key) for _ in range(CALLS_PER_CLIENT) for key in clients]
+    run_concurrently(calls)
+    assert mismatches == []
+
+def test_pooled_session_beats_connection_per_call(stand_in):
+    client = make_client(stand_in, "key-a")
+    model = ModelConfig(name="qwen-turbo")
+    calls = 200
+
+    def per_call_connection():
+        # 旧实现每次调用都通过SDK新建连接
+        response = requests.post(client.generation_url, headers=client.headers, json={"model": model.name}, timeout=10)
+        return response.json()["output"]["choices"][0]["message"]["content"] == "key-a"
+
+    def pooled():
+        return client.test_model("ping", model).success
+
+    baseline = run_concurrently([per_call_connection] * calls)
+    reused = run_concurrently([pooled] * calls)
+    assert reused > baseline * 1.5, f"每次新建连接: {baseline:.0f} 次/秒, 复用连接池: {reused:.0f} 次/秒"
@@ -0,0 +1,141 @@
+"""请求截止时间的测试：服务端持续缓慢发送数据时，整个请求也不应超过timeout
+
+本地替身服务按路径模拟不同的异常情况，单次读写的间隔都小于timeout，只有按截止时间
+重新计算每次读写的超时才能让请求按时结束。
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from api_clients import AlibabaClient, OpenAIClient
+from api_clients.transport import DeadlineNetworkBackend, install_httpx_deadline
+from config_manager import ModelConfig, PlatformConfig
+
+from conftest import COMPLETION
+
+TIMEOUT = 1.0
+# 缓慢发送时每个字节之间的间隔（秒）
+TRICKLE_INTERVAL = 0.1
+
+DASHSCOPE_COMPLETION = {
+    "output": {"choices": [{"message": {"content": "ok"}}]},
+    "usage": {"input_tokens": 1, "output_tokens": 1, "total_tokens": 2}
+}
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """/trickle-body：响应头正常返回，响应体缓慢发送；/trickle-headers：响应头缓慢发送；
+    /flaky：第一次返回429，之后正常返回；/rate-limited：总是返回429，Retry-After超过timeout
+    """
+    protocol_version = "HTTP/1.1"
+    requests_seen = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StandInHandler.requests_seen += 1
+        body = json.dumps(COMPLETION if "chat/completions" in self.path else DASHSCOPE_COMPLETION).encode()
+        try:
+            if self.path.startswith("/trickle-body"):
+                self.send_head(200, len(body) + 1000)
+                self.trickle(body)
+            elif self.path.startswith("/trickle-headers"):
+                self.trickle(b"HTTP/1.1 200 OK\r\n" + b"X-Padding: " + b"." * 1000 + b"\r\n")
+            elif self.path.startswith("/flaky") and StandInHandler.requests_seen == 1:
+                self.send_json(429, {"error": {"message": "rate limited"}}, retry_after="0.05")
+            elif self.path.startswith("/rate-limited"):
+                self.send_json(429, {"error": {"message": "rate limited"}}, retry_after="5")
+            else:
+                self.send_json(200, json.loads(body))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def send_head(self, status: int, length: int, retry_after: str = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(length))
+        if retry_after:
+            self.send_header("Retry-After", retry_after)
+        self.end_headers()
+        self.wfile.flush()
+
+    def send_json(self, status: int, body: dict, retry_after: str = None):
+        data = json.dumps(body).encode()
+        self.send_head(status, len(data), retry_after)
+        self.wfile.write(data)
+
+    def trickle(self, data: bytes):
+        for i in range(len(data)):
+            self.wfile.write(data[i:i + 1])
+            self.wfile.flush()
+            time.sleep(TRICKLE_INTERVAL)
+
+@pytest.fixture
+def stand_in():
+    StandInHandler.requests_seen = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+def openai_client(base_url: str, max_retries: int = 2) -> OpenAIClient:
+    return OpenAIClient(PlatformConfig(
+        name="openai", enabled=True, api_key="sk-test", models=[], base_url=f"{base_url}/v1",
+        timeout=TIMEOUT, max_retries=max_retries
+    ))
+
+def alibaba_client(base_url: str, max_retries: int = 2) -> AlibabaClient:
+    return AlibabaClient(PlatformConfig(
+        name="alibaba", enabled=True, api_key="sk-test", models=[], base_url=f"{base_url}/api/v1",
+        timeout=TIMEOUT, max_retries=max_retries
+    ))
+
+CLIENTS = [pytest.param(openai_client, id="httpx"), pytest.param(alibaba_client, id="requests")]
+
+def test_httpx_deadline_backend_installed():
+    client = openai_client("http://127.0.0.1:9")
+    backend = client.client._client._transport._pool._network_backend
+    assert isinstance(backend, DeadlineNetworkBackend)
+    # 重复安装不会再包一层
+    assert install_httpx_deadline(client.client._client)
+    assert client.client._client._transport._pool._network_backend is backend
+
+@pytest.mark.parametrize("make_client", CLIENTS)
+@pytest.mark.parametrize("path", ["trickle-body", "trickle-headers"])
+def test_trickled_response_stops_at_deadline(stand_in, make_client, path):
+    client = make_client(f"{stand_in}/{path}")
+    start = time.monotonic()
+    response = client.test_model("ping", ModelConfig(name="test-model"))
+    elapsed = time.monotonic() - start
+
+    assert not response.success
+    assert response.timed_out, response.error
+    assert TIMEOUT * 0.9 <= response.latency <= TIMEOUT + 0.3
+    assert elapsed <= TIMEOUT + 0.3
+
+@pytest.mark.parametrize("make_client", CLIENTS)
+def test_rate_limited_request_is_retried(stand_in, make_client):
+    client = make_client(f"{stand_in}/flaky")
+    response = client.test_model("ping", ModelConfig(name="test-model"))
+
+    assert response.success, response.error
+    assert response.response == "ok"
+    assert StandInHandler.requests_seen == 2
+
+@pytest.mark.parametrize("make_client", CLIENTS)
+def test_retry_after_beyond_deadline_is_not_waited(stand_in, make_client):
+    client = make_client(f"{stand_in}/rate-limited")
+    response = client.test_model("ping", ModelConfig(name="test-model"))
+
+    # Retry-After超过剩余时间，不等待重试，直接返回限流错误
+    assert not response.success
+    assert not response.timed_out
+    assert "429" in response.error
+    assert response.latency < TIMEOUT / 2
+    assert StandInHandler.requests_seen == 1
@@ -0,0 +1,68 @@
+"""回答评估流水线的测试"""
+import time
+from types import SimpleNamespace
+
+from evaluators import EVALUATORS, EvaluationPipeline, register_evaluator
+
+def evaluate_length(response, spec):
+    return {'score': 1.0 if len(response) >= spec['min_length'] else 0.0, 'detail': f'长度{len(response)}'}
+
+def evaluate_slowly(response, spec):
+    time.sleep(spec['seconds'])
+    return {'score': 1.0, 'detail': '完成'}
+
+def make_result(response):
+    return SimpleNamespace(success=True, response=response, evaluation=None, score=None)
+
+def test_evaluator_registered_after_pool_started():
+    pipeline = EvaluationPipeline({'max_workers': 2})
+    try:
+        # 先提交一次评估让进程池启动，再注册自定义评估器
+        warmup = make_result("数据和模型")
+        assert pipeline.submit(warmup, 'general', {'type': 'keywords', 'keywords': ['数据']})
+        pipeline.drain()
+        assert warmup.score == 1.0
+
+        register_evaluator('length', evaluate_length)
+        results = [make_result("x" * n) for n in (3, 10)]
+        for result in results:
+            assert pipeline.submit(result, 'general', {'type': 'length', 'min_length': 5})
+        pipeline.drain()
+        assert [result.score for result in results] == [0.0, 1.0]
+    finally:
+        pipeline.close()
+        EVALUATORS.pop('length', None)
+
+def test_code_execution_requires_opt_in():
+    pipeline = EvaluationPipeline({'max_workers': 1})
+    try:
+        result = make_result("```python\nimport os\nos.system('true')\n```")
+        assert not pipeline.submit(result, 'coding', {'type': 'python', 'tests': []})
+        assert result.score is None
+        assert 'allow_code_execution' in result.evaluation['detail']
+        assert pipeline._executor is None
+    finally:
+        pipeline.close()
+
+def test_cancelled_close_keeps_finished_scores():
+    pipeline = EvaluationPipeline({'max_workers': 1, 'max_pending': 8})
+    register_evaluator('slow', evaluate_slowly)
+    try:
+        results = [make_result("x") for _ in range(8)]
+        for result in results:
+            assert pipeline.submit(result, 'general', {'type': 'slow', 'seconds': 0.2})
+        time.sleep(0.5)
+        # 模拟测试中断：尚未开始的评估被取消，已完成和正在运行的评估写回得分
+        start = time.monotonic()
+        pipeline.close(cancel=True)
+        assert time.monotonic() - start < 0.2 * 4
+        assert pipeline._executor is None
+        scores = [result.score for result in results]
+        assert scores[0] == 1.0
+        assert None in scores
+        finished = scores.index(None)
+        assert scores[:finished] == [1.0] * finished
+        assert all(result.evaluation['detail'] == '评估已取消' for result in results[finished:])
+    finally:
+        pipeline.close()
+        EVALUATORS.pop('slow', None)
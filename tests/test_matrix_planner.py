@@ -0,0 +1,106 @@
+"""测试矩阵规划器的测试：去重、抽样和count()的快速路径"""
+from collections import Counter
+
+import pytest
+import yaml
+
+from config_manager import ConfigManager
+from matrix_planner import MatrixPlanner
+
+CONFIG = {
+    "platforms": {
+        "openai": {
+            "enabled": True,
+            "api_key": "sk-test",
+            "models": [
+                {"name": "gpt-a", "temperature": 0.7, "parameter_grid": {"temperature": [0.2, 0.7]}},
+                # 同一模型再次出现，网格与上一条在temperature=0.7处重叠
+                {"name": "gpt-a", "temperature": 0.7, "parameter_grid": {"temperature": [0.7, 1.0]}},
+                {"name": "gpt-b"},
+            ]
+        },
+        "anthropic": {
+            "enabled": True,
+            "api_key": "sk-test",
+            "models": [{"name": "claude-x"}]
+        }
+    },
+    "test_settings": {
+        "test_prompts": [
+            {"prompt": "p1", "category": "reasoning"},
+            {"prompt": "p1", "category": "reasoning"},
+            {"prompt": "p2", "category": "coding"},
+            {"prompt": "p3"},
+        ],
+        "matrix": {"parameter_grid": {"max_tokens": [100, 200, 400]}}
+    }
+}
+
+@pytest.fixture(scope="module")
+def config_manager(tmp_path_factory):
+    path = tmp_path_factory.mktemp("config") / "config.yaml"
+    path.write_text(yaml.safe_dump(CONFIG), encoding="utf-8")
+    return ConfigManager(str(path))
+
+def make_planner(config_manager, **settings) -> MatrixPlanner:
+    matrix_settings = dict(CONFIG["test_settings"]["matrix"], **settings)
+    return MatrixPlanner(config_manager, matrix_settings=matrix_settings)
+
+def test_overlapping_model_entries_are_emitted_once(config_manager):
+    tasks = list(make_planner(config_manager).iter_tasks())
+    keys = [task.key for task in tasks]
+    assert len(keys) == len(set(keys))
+
+    combos = Counter(
+        (task.model_config.temperature, task.model_config.max_tokens, task.prompt)
+        for task in tasks if task.model_config.name == "gpt-a"
+    )
+    assert set(combos.values()) == {1}
+    assert sorted({temperature for temperature, _, _ in combos}) == [0.2, 0.7, 1.0]
+    # 3个temperature × 3个max_tokens × 3个提示词
+    assert len(combos) == 27
+
+def test_duplicate_prompts_are_collapsed(config_manager):
+    planner = make_planner(config_manager)
+    assert planner.prompts == [("p1", "reasoning"), ("p2", "coding"), ("p3", "general")]
+
+@pytest.mark.parametrize("settings", [
+    {},
+    {"exclude": [{"platform": "anthropic"}, {"model": "gpt-a", "temperature": 1.0}]},
+    {"sample_rate": 0.3},
+    {"sample_per_stratum": 2},
+    {"exclude": [{"category": "coding"}], "sample_rate": 0.5, "sample_per_stratum": 3},
+], ids=["fast-path", "exclude", "sample-rate", "per-stratum", "combined"])
+def test_count_matches_iter_tasks(config_manager, settings):
+    planner = make_planner(config_manager, **settings)
+    assert planner.count() == len(list(planner.iter_tasks()))
+
+def test_exclude_rules_are_applied(config_manager):
+    planner = make_planner(config_manager, exclude=[{"platform": "anthropic"}, {"model": "gpt-a", "temperature": 1.0}])
+    tasks = list(planner.iter_tasks())
+    assert all(task.platform != "anthropic" for task in tasks)
+    assert not any(task.model_config.name == "gpt-a" and task.model_config.temperature == 1.0 for task in tasks)
+
+def test_sampling_is_reproducible(config_manager):
+    keys = lambda planner: [task.key for task in planner.iter_tasks()]
+    first = make_planner(config_manager, sample_rate=0.5, seed=7)
+    second = make_planner(config_manager, sample_rate=0.5, seed=7)
+    full = len(list(make_planner(config_manager).iter_tasks()))
+    assert keys(first) == keys(second)
+    assert 0 < len(keys(first)) < full
+
+def test_each_stratum_holds_at_most_k_tasks(config_manager):
+    k = 2
+    planner = make_planner(config_manager, sample_per_stratum=k, seed=3)
+    tasks = list(planner.iter_tasks())
+    strata = Counter(tuple(task.get(name) for name in planner.stratify_by) for task in tasks)
+    full = Counter(
+        tuple(task.get(name) for name in planner.stratify_by) for task in make_planner(config_manager).iter_tasks()
+    )
+
+    assert set(strata) == set(full)
+    for stratum, size in full.items():
+        assert strata[stratum] == min(k, size)
+
+    again = make_planner(config_manager, sample_per_stratum=k, seed=3)
+    assert [task.key for task in again.iter_tasks()] == [task.key for task in tasks]
@@ -0,0 +1,74 @@
+"""完整回答附属文件的往返测试：保存测试结果后按结果ID读回任意一条记录"""
+import gzip
+import io
+import json
+import os
+
+import pytest
+import yaml
+
+from api_clients import APIResponse
+from llm_tester import LLMTester
+from result_analyzer import ResultAnalyzer
+
+RESULTS = 5
+
+def make_response(i: int) -> APIResponse:
+    # 每条回答长度不同，偏移错位时读出的内容必然不一致
+    return APIResponse(
+        platform="openai", model="gpt-test", prompt=f"p{i}",
+        response=f"回答{i}:" + "数据" * (200 * (i + 1)),
+        usage={"prompt_tokens": 1, "completion_tokens": i, "total_tokens": i + 1},
+        latency=0.1, success=True, raw_response={"id": f"chatcmpl-{i}"}, timestamp=1.0
+    )
+
+def read_all_frames(path: str, codec: str) -> bytes:
+    """不使用索引，按标准格式把拼接的多帧一次解压"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if codec == "gzip":
+        return gzip.decompress(data)
+    import zstandard
+    return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True).read()
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_detailed_responses_round_trip(tmp_path, codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    results_dir = tmp_path / "results"
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump({
+        "platforms": {},
+        "test_settings": {
+            "results_path": str(results_dir),
+            "save_detailed_responses": True,
+            "save_raw_responses": True,
+            "response_compression": codec,
+            "save_csv": False,
+            "save_to_database": False
+        }
+    }), encoding="utf-8")
+
+    tester = LLMTester(str(config_path))
+    tester.results = [make_response(i) for i in range(RESULTS)]
+    tester.save_results()
+    run_id = tester.run_id
+
+    with open(results_dir / f"test_results_{run_id}.json", encoding="utf-8") as f:
+        saved = json.load(f)
+    middle = saved[RESULTS // 2]
+    assert len(middle["response"]) < len(tester.results[RESULTS // 2].response)
+
+    analyzer = ResultAnalyzer(results_dir=str(results_dir), pricing={})
+    record = analyzer.load_response(middle["result_id"])
+    assert record == {"response": make_response(RESULTS // 2).response, "raw_response": {"id": "chatcmpl-2"}}
+    for i in (0, RESULTS - 1):
+        assert analyzer.load_response(f"{run_id}-{i}")["response"] == make_response(i).response
+
+    extension = {"gzip": "gz", "zstd": "zst"}[codec]
+    data_path = os.path.join(results_dir, f"responses_{run_id}.jsonl.{extension}")
+    lines = read_all_frames(data_path, codec).decode("utf-8").splitlines()
+    assert [json.loads(line)["response"] for line in lines] == [make_response(i).response for i in range(RESULTS)]
+
+    assert analyzer.load_response(f"{run_id}-{RESULTS}") is None
+    assert analyzer.load_response("20000101_000000_000000000-0") is None
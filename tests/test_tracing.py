@@ -0,0 +1,26 @@
+"""请求时间线追踪的测试：重试的每次尝试都应出现在时间线中"""
+from api_clients import OpenAIClient
+from config_manager import ModelConfig, PlatformConfig
+
+def test_retry_attempts_show_up_in_trace(flaky_server, tracer):
+    client = OpenAIClient(PlatformConfig(
+        name="openai", enabled=True, api_key="sk-test", models=[], base_url=flaky_server, timeout=10, max_retries=2
+    ))
+    response = client.test_model("ping", ModelConfig(name="gpt-test"))
+    assert response.success
+
+    request = next(span for span in tracer.spans if span.name == "request")
+    attempts = sorted((span for span in tracer.spans if span.name == "attempt"), key=lambda span: span.start_ns)
+    backoffs = [span for span in tracer.spans if span.name == "backoff"]
+    assert [span.attributes["attempt"] for span in attempts] == [1, 2, 3]
+    assert [span.error for span in attempts] == [True, True, False]
+    assert len(backoffs) == 2
+    assert all(span.parent_id == request.span_id for span in attempts + backoffs)
+
+    # 每次尝试下都有各自的TTFB阶段
+    attempt_ids = {span.span_id for span in attempts}
+    ttfb_parents = [span.parent_id for span in tracer.spans if span.name == "ttfb"]
+    assert sorted(ttfb_parents) == sorted(attempt_ids)
+
+    events = tracer.to_chrome_trace()["traceEvents"]
+    assert sum(1 for event in events if event["name"] == "attempt") == 3
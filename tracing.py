@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 设置该环境变量为1/true即可开启请求时间线追踪
+TRACE_ENV_VAR = "LLM_TEST_TRACE"
+
+# httpcore追踪事件 -> 子span名称
+HTTPCORE_PHASES = {
+    'connect_tcp': 'connect',
+    'connect_unix_socket': 'connect',
+    'start_tls': 'tls',
+    'send_request_headers': 'send',
+    'send_request_body': 'send',
+    'receive_response_headers': 'ttfb',
+    'receive_response_body': 'stream',
+}
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: int = 0
+    thread_id: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: bool = False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+class _NullSpan:
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _SpanContext:
+    __slots__ = ('recorder', 'span')
+
+    def __init__(self, recorder: 'TraceRecorder', span: Span):
+        self.recorder = recorder
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.recorder._stack().append(self.span)
+        self.span.start_ns = time.time_ns()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.span.error = True
+            self.span.attributes.setdefault('error', str(exc))
+        self.recorder._stack().pop()
+        self.recorder.spans.append(self.span)
+        return False
+
+class TraceRecorder:
+    """请求时间线记录器
+
+    每个请求记录为一个span，排队、连接、首字节(TTFB)、流式读取等阶段记录为子span。
+    当前span按线程保存，SDK的HTTP钩子在调用线程中执行时会自动挂到正在进行的请求下。
+    结果可导出为Chrome trace-event JSON（Perfetto/chrome://tracing可直接打开）
+    和OTLP JSON文件。
+    """
+
+    def __init__(self, enabled: bool = False, service_name: str = "llm_test"):
+        self.enabled = enabled
+        self.service_name = service_name
+        self.spans: List[Span] = []
+        self._local = threading.local()
+        self._trace_id = os.urandom(16).hex()
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current_span(self) -> Optional[Span]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def _new_span(self, name: str, parent: Optional[Span], start_ns: int, attributes: Dict[str, Any]) -> Span:
+        return Span(
+            name=name,
+            trace_id=self._trace_id,
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            start_ns=start_ns,
+            thread_id=threading.get_ident(),
+            attributes=attributes
+        )
+
+    def span(self, name: str, **attributes):
+        """开始一个span，用法: with tracer.span("request", model=...) as span: ..."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _SpanContext(self, self._new_span(name, self.current_span(), 0, attributes))
+
+    def add_span(self, name: str, start_ns: int, end_ns: int, **attributes):
+        """记录一个已经结束的阶段，作为当前span的子span"""
+        if not self.enabled:
+            return
+        span = self._new_span(name, self.current_span(), start_ns, attributes)
+        span.end_ns = end_ns
+        self.spans.append(span)
+
+    def httpcore_trace(self, started: Dict[str, int]):
+        """生成httpcore的trace回调，连接、发送、TTFB、读取响应体等阶段记为当前span的子span"""
+        def trace(event_name: str, info: Dict[str, Any]):
+            prefix, _, phase = event_name.rpartition('.')
+            if phase == 'started':
+                started[prefix] = time.time_ns()
+                return
+            if phase not in ('complete', 'failed'):
+                return
+
+            now = time.time_ns()
+            step = prefix.rpartition('.')[2]
+            start_ns = started.pop(prefix, None)
+            name = HTTPCORE_PHASES.get(step)
+            if start_ns is not None and name:
+                self.add_span(name, start_ns, now, failed=phase == 'failed')
+        return trace
+
+    def instrument_httpx(self, http_client):
+        """在httpx客户端上注册请求钩子，为每次HTTP请求挂上httpcore的trace回调"""
+        if http_client is None or not hasattr(http_client, 'event_hooks'):
+            return
+
+        def on_request(request):
+            if not self.enabled or self.current_span() is None:
+                return
+            request.extensions['trace'] = self.httpcore_trace({})
+
+        hooks = http_client.event_hooks
+        hooks.setdefault('request', []).append(on_request)
+        http_client.event_hooks = hooks
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        pid = os.getpid()
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        events = []
+        for tid in sorted({span.thread_id for span in self.spans}):
+            events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                'args': {'name': thread_names.get(tid, f"worker-{tid}")}
+            })
+        for span in sorted(self.spans, key=lambda s: (s.start_ns, -s.end_ns)):
+            args = dict(span.attributes)
+            if span.error:
+                args['error'] = args.get('error', True)
+            events.append({
+                'name': span.name,
+                'cat': 'llm_test',
+                'ph': 'X',
+                'ts': span.start_ns / 1000,
+                'dur': max(span.end_ns - span.start_ns, 0) / 1000,
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': args
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    @staticmethod
+    def _otlp_value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {'boolValue': value}
+        if isinstance(value, int):
+            return {'intValue': str(value)}
+        if isinstance(value, float):
+            return {'doubleValue': value}
+        return {'stringValue': str(value)}
+
+    def to_otlp(self) -> Dict[str, Any]:
+        spans = []
+        for span in self.spans:
+            otlp_span = {
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': 3 if span.name == 'request' else 1,
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': [
+                    {'key': key, 'value': self._otlp_value(value)}
+                    for key, value in span.attributes.items() if value is not None
+                ],
+                'status': {'code': 2 if span.error else 1}
+            }
+            if span.parent_id:
+                otlp_span['parentSpanId'] = span.parent_id
+            spans.append(otlp_span)
+
+        return {
+            'resourceSpans': [{
+                'resource': {
+                    'attributes': [{'key': 'service.name', 'value': {'stringValue': self.service_name}}]
+                },
+                'scopeSpans': [{
+                    'scope': {'name': self.service_name},
+                    'spans': spans
+                }]
+            }]
+        }
+
+    def write(self, output_dir: str, tag: str) -> List[str]:
+        """保存Chrome trace和OTLP两种格式，返回写入的文件路径"""
+        os.makedirs(output_dir, exist_ok=True)
+
+        chrome_file = os.path.join(output_dir, f'trace_{tag}.json')
+        with open(chrome_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+
+        otlp_file = os.path.join(output_dir, f'trace_{tag}.otlp.json')
+        with open(otlp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.to_otlp(), f, ensure_ascii=False)
+
+        return [chrome_file, otlp_file]
+
+_tracer = TraceRecorder(
+    enabled=os.environ.get(TRACE_ENV_VAR, '').lower() in ('1', 'true', 'yes')
+)
+
+def get_tracer() -> TraceRecorder:
+    return _tracer
+
+def enable_tracing() -> TraceRecorder:
+    _tracer.enabled = True
+    return _tracer